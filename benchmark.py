@@ -0,0 +1,347 @@
+"""Benchmarks for Mythic Tracker hot paths
+
+Usage: python benchmark.py [case ...] [--players N] [--runs N] [--latency S]
+       [--error-rate F] [--throttle-rate F] [--no-etags] [--output FILE]
+
+Runs every registered case (or only the named ones), each in its own
+process so peak RSS is per case, and prints the results as JSON so runs
+from different commits can be compared. Cases use the bundled apireply.txt
+and dungeon_cache.json fixtures, a throwaway database and the local
+fake_raiderio server, never the real API or the bot's database.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Real run-details reply bundled with the repo
+API_REPLY_FILE = os.path.join(BASE_DIR, "apireply.txt")
+
+# Registered benchmark cases, name -> function(options) returning a list of results
+CASES = {}
+
+def case(name):
+    """Register a benchmark case"""
+    def register(func):
+        CASES[name] = func
+        return func
+    return register
+
+def percentile(sorted_values, fraction):
+    """Get a percentile from an already sorted list"""
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+def summarize(name, timings, **extra):
+    """Build a result entry from per-operation timings in seconds"""
+    timings = sorted(timings)
+    total = sum(timings)
+    return {
+        "name": name,
+        "operations": len(timings),
+        "p50_ms": round(percentile(timings, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(timings, 0.99) * 1000, 3),
+        "ops_per_sec": round(len(timings) / total, 1) if total else None,
+        **extra
+    }
+
+def measure(name, func, repeat=20):
+    """Time func over repeat calls and trace the peak memory of one more call"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    result = func()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return summarize(
+        name, timings,
+        peak_alloc_kb=round(peak / 1024, 1),
+        retained_alloc_kb=round(retained / 1024, 1)
+    )
+
+def free_port():
+    """Get a free local TCP port for the fake API"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def prepare_environment(workdir, api_port):
+    """Point the bot's configuration at a throwaway database and the fake API"""
+    os.environ["DATABASE_FILE"] = os.path.join(workdir, "benchmark.db")
+    os.environ["RAIDERIO_API_URL"] = f"http://127.0.0.1:{api_port}/api/v1"
+    # Measure the bot, not the client-side rate limit
+    os.environ["RAIDERIO_REQUESTS_PER_MINUTE"] = "600000"
+
+    defaults = {
+        "DISCORD_TOKEN": "benchmark",
+        "CHECK_INTERVAL": "60",
+        "API_ACCESS_KEY": "benchmark",
+        "CURRENT_EXPANSION": "10",
+        "CURRENT_SEASON": "season-tww-3",
+        "CURRENT_SEASON_SHORT": "TWW3",
+        "EMBED_COLOR": "39423",
+        "WEB_HOST": "127.0.0.1",
+        "WEB_PORT": "5000",
+        "WEB_DEBUG": "false",
+        "CLIENT_ID": "0",
+        "FLASK_SECRET_KEY": "benchmark"
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+def load_run_details():
+    """Get apireply.txt decoded the way the bot decodes run details"""
+    from run_details_parser import parse_run_details
+    with open(API_REPLY_FILE, "rb") as f:
+        return parse_run_details(f.read())
+
+def sample_profiles(count, runs_per_profile=10):
+    """Build synthetic character profiles like the ones the fake API serves"""
+    import fake_raiderio
+    dungeons = fake_raiderio.load_dungeons()
+    return [
+        fake_raiderio.make_profile(f"bench{index}", "dalaran", "us", dungeons, runs_per_profile)
+        for index in range(count)
+    ]
+
+def sample_run(profile):
+    """Merge a profile's latest run with the bundled run details, like get_run_details does"""
+    run_data = dict(profile["mythic_plus_recent_runs"][0])
+    for key, value in load_run_details().items():
+        if key not in run_data or not run_data[key]:
+            run_data[key] = value
+    return run_data
+
+@case("parse_run_details")
+def bench_parse_run_details(options):
+    """Full json.loads against the selective run-details parser, on apireply.txt"""
+    from run_details_parser import parse_run_details
+
+    with open(API_REPLY_FILE, "rb") as f:
+        pretty = f.read()
+    # The live API sends compact JSON, the bundled reply is pretty-printed
+    compact = json.dumps(json.loads(pretty), separators=(",", ":")).encode("utf-8")
+
+    results = []
+    for label, body in (("compact", compact), ("pretty", pretty)):
+        results.append(measure(f"json.loads ({label})", lambda: json.loads(body)))
+        results.append(measure(f"parse_run_details ({label})", lambda: parse_run_details(body)))
+    return results
+
+@case("parse_recent_runs")
+def bench_parse_recent_runs(options):
+    """RaiderIO.parse_mythic_plus_runs and get_latest_run on synthetic profiles"""
+    from raiderio_api import RaiderIO
+
+    rio = RaiderIO()
+    profiles = sample_profiles(options.players)
+    timings = []
+    for profile in profiles:
+        started = time.perf_counter()
+        rio.get_latest_run(rio.parse_mythic_plus_runs(profile))
+        timings.append(time.perf_counter() - started)
+    return [summarize("parse_mythic_plus_runs + get_latest_run", timings)]
+
+@case("create_run_embed")
+def bench_create_run_embed(options):
+    """utils.create_run_embed for a run merged with the bundled run details"""
+    import utils
+
+    profile = sample_profiles(1)[0]
+    run_data = sample_run(profile)
+    return [measure("create_run_embed", lambda: utils.create_run_embed(run_data, profile), repeat=200)]
+
+@case("get_death_information")
+def bench_get_death_information(options):
+    """utils.get_death_information for the bundled run details"""
+    import utils
+
+    run_data = load_run_details()
+    roster = run_data.get("roster", [])
+    return [measure("get_death_information", lambda: utils.get_death_information(run_data, roster), repeat=1000)]
+
+@case("add_run")
+def bench_add_run(options):
+    """Database.add_run for many runs, each linked to one tracked player"""
+    from database import Database
+
+    db = Database()
+    db.migrate()
+    run_data = load_run_details()
+
+    players_count = max(1, options.runs // 10)
+    for index in range(players_count):
+        db.add_player(f"bench{index}", "dalaran", "us", "1")
+    player_ids = [player["id"] for player in db.get_all_players()]
+
+    timings = []
+    for index in range(options.runs):
+        run_id = 1000000 + index
+        record = dict(run_data, keystone_run_id=run_id)
+        started = time.perf_counter()
+        db.add_run(
+            player_ids[index % len(player_ids)], run_id, "Cinderbrew Meadery", 10,
+            run_data.get("completed_at", ""), True, 1500000, 300.0,
+            f"https://raider.io/mythic-plus-runs/season-tww-3/{run_id}", record
+        )
+        timings.append(time.perf_counter() - started)
+
+    # Fold the WAL back into the main file so the size reflects the stored runs
+    with db._writer() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    size = sum(
+        os.path.getsize(path)
+        for path in (db.db_file, db.db_file + "-wal", db.db_file + "-shm")
+        if os.path.exists(path)
+    )
+    size_kb = round(size / 1024, 1)
+    db.close()
+    return [summarize("add_run", timings, database_kb=size_kb)]
+
+@case("sweep")
+def bench_sweep(options):
+    """Check every tracked character twice through the bot's workers, against fake_raiderio"""
+    return asyncio.run(_run_sweep(options))
+
+async def _run_sweep(options):
+    import fake_raiderio
+    import main
+
+    runner = await fake_raiderio.start_server(
+        port=options.api_port, latency=options.latency, error_rate=options.error_rate,
+        throttle_rate=options.throttle_rate, seed=0, etags=options.etags
+    )
+    stats = runner.app["stats"]
+    try:
+        for index in range(options.players):
+            await main.db.add_player(f"bench{index}", "dalaran", "us", str(index % 5))
+
+        # Time each character check inside the real worker loop
+        timings = []
+        check_character_runs = main.check_character_runs
+
+        async def timed_check(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await check_character_runs(*args, **kwargs)
+            finally:
+                timings.append(time.perf_counter() - started)
+
+        main.check_character_runs = timed_check
+
+        main.check_workers.extend(asyncio.create_task(main.check_worker()) for _ in range(main.config.MAX_CONCURRENT_CHECKS))
+        results = []
+
+        # First sweep sees every profile for the first time, the repeat sweep
+        # finds them all unchanged
+        for sweep_number, label in enumerate(("sweep", "repeat sweep"), 1):
+            timings.clear()
+            requests_before = dict(stats)
+            started = time.perf_counter()
+            if sweep_number == 1:
+                await main.refresh_check_queue()
+            else:
+                for key in main.group_players_by_character(await main.db.get_all_players()):
+                    main.check_queue.schedule(key, priority=main.scheduler.HIGH_PRIORITY)
+            while main.check_queue.completed < options.players * sweep_number:
+                await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - started
+
+            results.append(summarize(
+                f"{label} of {options.players} characters", timings,
+                wall_seconds=round(elapsed, 3),
+                characters_per_sec=round(options.players / elapsed, 1),
+                workers=main.config.MAX_CONCURRENT_CHECKS,
+                api_requests={name: count - requests_before[name] for name, count in stats.items()}
+            ))
+
+        await main.stop_check_workers()
+        return results
+    finally:
+        await runner.cleanup()
+        main.db.close()
+
+def run_case(name, options):
+    """Run one case in this process and print its results as a single JSON line"""
+    workdir = tempfile.mkdtemp(prefix="mythic-benchmark-")
+    options.api_port = free_port()
+    prepare_environment(workdir, options.api_port)
+    os.chdir(BASE_DIR)
+
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = CASES[name](options)
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stdout.write(json.dumps({"results": results, "peak_rss_kb": peak_rss_kb}) + "\n")
+
+def main(argv):
+    """Run the selected cases, each in a fresh process, and print the results as JSON"""
+    parser = argparse.ArgumentParser(description="Benchmark Mythic Tracker hot paths")
+    parser.add_argument("cases", nargs="*", help=f"cases to run (default: all of {', '.join(CASES)})")
+    parser.add_argument("--players", type=int, default=200, help="characters for profile parsing and the sweep")
+    parser.add_argument("--runs", type=int, default=2000, help="runs stored by the add_run case")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake API adds to each sweep response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of sweep requests failing with a 5xx error")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of sweep requests answered with a 429")
+    parser.add_argument("--no-etags", dest="etags", action="store_false", help="make the fake API send no ETags, so only fingerprints detect unchanged profiles")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+
+    if options.run_case:
+        run_case(options.run_case, options)
+        return 0
+
+    unknown = [name for name in options.cases if name not in CASES]
+    if unknown:
+        parser.error(f"unknown benchmark case(s): {', '.join(unknown)}")
+
+    report = {
+        "python": sys.version.split()[0],
+        "players": options.players,
+        "runs": options.runs,
+        "latency": options.latency,
+        "error_rate": options.error_rate,
+        "throttle_rate": options.throttle_rate,
+        "etags": options.etags,
+        "cases": {}
+    }
+    for name in options.cases or CASES:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-case", name,
+             "--players", str(options.players), "--runs", str(options.runs),
+             "--latency", str(options.latency), "--error-rate", str(options.error_rate),
+             "--throttle-rate", str(options.throttle_rate)] + ([] if options.etags else ["--no-etags"]),
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            report["cases"][name] = {"error": completed.stderr.strip().splitlines()[-1:]}
+            continue
+        report["cases"][name] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -19,11 +19,43 @@ if not CHECK_INTERVAL_STR:
     raise ValueError("CHECK_INTERVAL must be set in the .env file")
 CHECK_INTERVAL = int(CHECK_INTERVAL_STR)
 
+# Longest time in seconds between checks of a dormant character (optional)
+MAX_CHECK_INTERVAL = int(os.getenv("MAX_CHECK_INTERVAL", "21600"))
+
+# Number of check workers polling characters concurrently (optional)
+MAX_CONCURRENT_CHECKS = int(os.getenv("MAX_CONCURRENT_CHECKS", "10"))
+
+# Maximum simultaneous connections to the Raider.io host (optional)
+RAIDERIO_CONNECTION_LIMIT = int(os.getenv("RAIDERIO_CONNECTION_LIMIT", "10"))
+
+# Timeout in seconds for a single Raider.io request (optional)
+RAIDERIO_REQUEST_TIMEOUT = int(os.getenv("RAIDERIO_REQUEST_TIMEOUT", "30"))
+
+# Client-side Raider.io request budget per minute (optional)
+RAIDERIO_REQUESTS_PER_MINUTE = int(os.getenv("RAIDERIO_REQUESTS_PER_MINUTE", "300"))
+
+# Number of retries for throttled or failed Raider.io requests (optional)
+RAIDERIO_MAX_RETRIES = int(os.getenv("RAIDERIO_MAX_RETRIES", "3"))
+
+# Number of run details kept in memory and for how many seconds (optional)
+RUN_DETAILS_CACHE_SIZE = int(os.getenv("RUN_DETAILS_CACHE_SIZE", "128"))
+RUN_DETAILS_CACHE_TTL = int(os.getenv("RUN_DETAILS_CACHE_TTL", "3600"))
+
 # Database file name (required)
 DATABASE_FILE = os.getenv("DATABASE_FILE")
 if not DATABASE_FILE:
     raise ValueError("DATABASE_FILE must be set in the .env file")
 
+# Maximum number of pooled reader connections, and seconds to wait for one (optional)
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "4"))
+DATABASE_POOL_TIMEOUT = int(os.getenv("DATABASE_POOL_TIMEOUT", "10"))
+
+# Maximum number of database calls queued for the database thread (optional)
+DATABASE_QUEUE_SIZE = int(os.getenv("DATABASE_QUEUE_SIZE", "100"))
+
+# Keep compressed raw run-details payloads alongside compact run records (optional)
+STORE_RAW_RUN_PAYLOADS = os.getenv("STORE_RAW_RUN_PAYLOADS", "false").lower() == "true"
+
 # Raider.io API base URL (required)
 RAIDERIO_API_URL = os.getenv("RAIDERIO_API_URL")
 if not RAIDERIO_API_URL:
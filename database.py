@@ -1,142 +1,505 @@
 import sqlite3
 import os
 import json
+import asyncio
+import functools
 import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 import config
+import scheduler
 
-# Connection pooling setup
-class DatabaseConnectionPool:
-    def __init__(self, db_path):
-        self.db_path = db_path
-        self.pool = []
-        
-    def get_connection(self):
-        if not self.pool:
-            conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            conn.row_factory = sqlite3.Row
-            return conn
-        else:
-            return self.pool.pop()
-    
-    def release_connection(self, conn):
-        self.pool.append(conn)
+# How long a connection waits for a lock held by another connection
+BUSY_TIMEOUT_MS = 5000
 
-    def get_connection(self):
-        if not self.pool:
-            conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            conn.row_factory = sqlite3.Row
-            return conn
-        else:
-            return self.pool.pop()
+# Pragmas applied to every connection
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY"
+)
 
-    def release_connection(self, conn):
-        self.pool.append(conn)
+# Schema migrations applied by Database.migrate, in order, as (user_version, method)
+SCHEMA_MIGRATIONS = (
+    (1, '_create_base_tables'),
+    (2, '_create_run_tables'),
+    (3, '_create_lookup_indexes'),
+    (4, '_add_check_schedule'),
+    (5, '_add_run_watermark'),
+    (6, '_add_character_id'),
+    (7, '_add_profile_fingerprint'),
+    (8, '_add_realm_slug')
+)
+
+# Queries on request and sweep paths, shared by the Database methods and HOT_QUERIES
+PLAYER_BY_NAME_REALM_SQL = '''
+    SELECT * FROM players
+    WHERE name = ? AND realm = ? AND region = ? AND server_id = ?
+'''
+
+# Rows whose character ID is still unknown, matched by realm slug or by realm as typed
+PLAYERS_BY_CHARACTER_SQL = '''
+    SELECT * FROM players
+    WHERE name = ? AND region = ? AND character_id IS NULL
+    AND (realm_slug = ? OR realm = ?)
+'''
+
+PLAYERS_BY_CHARACTER_ID_SQL = 'SELECT * FROM players WHERE character_id = ?'
+
+PLAYERS_BY_SERVER_SQL = 'SELECT * FROM players WHERE server_id = ?'
+
+PLAYER_BY_ID_SQL = 'SELECT * FROM players WHERE id = ?'
+
+PLAYER_RUNS_SQL = '''
+    SELECT keystone_runs.* FROM player_runs
+    JOIN keystone_runs ON keystone_runs.keystone_run_id = player_runs.keystone_run_id
+    WHERE player_runs.player_id = ?
+    ORDER BY keystone_runs.completed_at DESC
+    LIMIT ?
+'''
+
+SERVER_RUNS_SQL = '''
+    SELECT DISTINCT keystone_runs.* FROM players
+    JOIN player_runs ON player_runs.player_id = players.id
+    JOIN keystone_runs ON keystone_runs.keystone_run_id = player_runs.keystone_run_id
+    WHERE players.server_id = ? AND keystone_runs.completed_at >= ?
+    ORDER BY keystone_runs.completed_at DESC
+'''
+
+RUN_PARTICIPANTS_SQL = 'SELECT * FROM run_participants WHERE keystone_run_id = ?'
+
+REMOVE_PLAYER_RUNS_SQL = '''
+    DELETE FROM player_runs WHERE player_id IN (
+        SELECT id FROM players
+        WHERE name = ? AND realm = ? AND region = ? AND server_id = ?
+    )
+'''
+
+REMOVE_PLAYER_SQL = '''
+    DELETE FROM players
+    WHERE name = ? AND realm = ? AND region = ? AND server_id = ?
+'''
+
+def linked_runs_sql(player_count, run_count):
+    """Build the linked player runs query for the given numbers of player and run IDs"""
+    return f'''
+        SELECT player_id, keystone_run_id FROM player_runs
+        WHERE player_id IN ({', '.join('?' * player_count)})
+        AND keystone_run_id IN ({', '.join('?' * run_count)})
+    '''
+
+# Queries that must be index-backed, as (name, sql, params).
+# Database.check_query_plans lists any of them that scans a whole table.
+HOT_QUERIES = (
+    ("player by name and realm", PLAYER_BY_NAME_REALM_SQL, ('name', 'realm', 'us', '0')),
+    ("players by character", PLAYERS_BY_CHARACTER_SQL, ('name', 'us', 'realm', 'realm')),
+    ("players by character id", PLAYERS_BY_CHARACTER_ID_SQL, (0,)),
+    ("players by server", PLAYERS_BY_SERVER_SQL, ('0',)),
+    ("player by id", PLAYER_BY_ID_SQL, (0,)),
+    ("player run history", PLAYER_RUNS_SQL, (0, 20)),
+    ("server run history", SERVER_RUNS_SQL, ('0', '')),
+    ("linked player runs", linked_runs_sql(2, 3), (0, 1, 0, 1, 2)),
+    ("run participants", RUN_PARTICIPANTS_SQL, (0,)),
+    ("remove player runs", REMOVE_PLAYER_RUNS_SQL, ('name', 'realm', 'us', '0')),
+    ("remove player", REMOVE_PLAYER_SQL, ('name', 'realm', 'us', '0'))
+)
+
+# Run fields kept in the compact run record stored in runs.run_data
+RUN_RECORD_FIELDS = (
+    "keystone_run_id", "mythic_plus_id", "season", "mythic_level", "completed_at",
+    "clear_time_ms", "par_time_ms", "keystone_time_ms", "num_chests",
+    "num_keystone_upgrades", "is_completed_within_time", "score", "url"
+)
+
+# Stored run_data larger than this predates compact run records
+COMPACT_RUN_DATA_THRESHOLD = 16384
+
+def _pick(data, *keys):
+    """Copy the given keys from a dict if present"""
+    if not isinstance(data, dict):
+        return {}
+    return {key: data[key] for key in keys if key in data}
+
+def compact_run_data(run_data):
+    """Reduce a merged run-details payload to the fields we render or query
+
+    The result keeps the same shape as the Raider.io payload, so it can be
+    passed straight to utils.create_run_embed.
+    """
+    record = _pick(run_data, *RUN_RECORD_FIELDS)
+
+    dungeon = run_data.get("dungeon")
+    if isinstance(dungeon, dict):
+        record["dungeon"] = _pick(dungeon, "id", "name", "short_name", "slug")
+    elif dungeon is not None:
+        record["dungeon"] = dungeon
+
+    affixes = run_data.get("affixes") or []
+    record["affixes"] = [
+        {"id": affix.get("id"), "name": affix.get("name")} if isinstance(affix, dict) else affix
+        for affix in affixes
+    ]
+
+    roster = []
+    for member in run_data.get("roster") or []:
+        if not isinstance(member, dict):
+            continue
+        character = member.get("character") or {}
+        roster.append({
+            "character": {
+                **_pick(character, "id", "name"),
+                "class": _pick(character.get("class"), "name"),
+                "spec": _pick(character.get("spec"), "name", "role"),
+                "realm": _pick(character.get("realm"), "name", "slug"),
+                "region": _pick(character.get("region"), "slug")
+            },
+            "ranks": _pick(member.get("ranks"), "score")
+        })
+    if roster:
+        record["roster"] = roster
+
+    logged_details = run_data.get("logged_details")
+    if isinstance(logged_details, dict):
+        record["logged_details"] = {
+            "deaths": [
+                _pick(death, "character_id")
+                for death in logged_details.get("deaths") or []
+                if isinstance(death, dict)
+            ]
+        }
+
+    return record
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes available in time"""
 
-# Connection pooling setup
 class DatabaseConnectionPool:
-    def __init__(self, db_path):
+    """Bounded pool of SQLite connections for one database file
+
+    WAL lets any number of readers run alongside a single writer, so the pool
+    keeps up to max_readers reader connections plus one writer connection.
+    Checkouts wait at most checkout_timeout seconds before raising PoolTimeout,
+    and idle connections are health-checked before they are handed out.
+    """
+
+    def __init__(self, db_path, max_readers=config.DATABASE_POOL_SIZE,
+                 checkout_timeout=config.DATABASE_POOL_TIMEOUT):
         self.db_path = db_path
-        self.pool = []
+        self.max_readers = max_readers
+        self.checkout_timeout = checkout_timeout
+
+        self._idle_readers = []
+        self._open_readers = 0
+        self._readers_available = threading.Condition()
+
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+        # Pool metrics
+        self.reader_checkouts = 0
+        self.writer_checkouts = 0
+        self.peak_readers_in_use = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.replaced = 0
+
+    def _connect(self):
+        """Open a connection with the shared pragmas applied"""
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+
+        # WAL lets the web thread read while the bot writes, and NORMAL
+        # synchronous only fsyncs at checkpoints instead of every commit
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _is_healthy(self, conn):
+        """Check that a pooled connection still answers"""
+        try:
+            conn.execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _replace(self, conn):
+        """Close a broken connection and open a fresh one"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self.replaced += 1
+        return self._connect()
 
     def get_connection(self):
-        if not self.pool:
-            conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            conn.row_factory = sqlite3.Row
-            return conn
-        else:
-            return self.pool.pop()
+        """Check out a reader connection, waiting up to checkout_timeout"""
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._readers_available:
+            while not self._idle_readers and self._open_readers >= self.max_readers:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.checkout_timeout}s")
+                self.waits += 1
+                self._readers_available.wait(remaining)
+
+            conn = self._idle_readers.pop() if self._idle_readers else None
+            if conn is None:
+                self._open_readers += 1
+            self.reader_checkouts += 1
+            in_use = self._open_readers - len(self._idle_readers)
+            self.peak_readers_in_use = max(self.peak_readers_in_use, in_use)
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif not self._is_healthy(conn):
+                conn = self._replace(conn)
+        except sqlite3.Error:
+            with self._readers_available:
+                self._open_readers -= 1
+                self._readers_available.notify()
+            raise
+        return conn
 
     def release_connection(self, conn):
-        self.pool.append(conn)
+        """Return a reader connection to the pool"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._readers_available:
+            self._idle_readers.append(conn)
+            self._readers_available.notify()
 
-class Database:
-    # Thread-local storage for database connections
-    _local = threading.local()
-    
-    # Connection pool instance
-    _connection_pool = None
-    
-    @classmethod
-    def get_connection_pool(cls):
-        """Get or create a connection pool instance"""
-        if cls._connection_pool is None:
-            cls._connection_pool = DatabaseConnectionPool(cls.db_file)
-        return cls._connection_pool
-    
-    # Connection pool instance
-    _connection_pool = None
-    
-    @classmethod
-    def get_connection_pool(cls):
-        """Get or create a connection pool instance"""
-        if cls._connection_pool is None:
-            cls._connection_pool = DatabaseConnectionPool(cls.db_file)
-        return cls._connection_pool
-    
-    # Connection pool instance
-    _connection_pool = None
-    
-    @classmethod
-    def get_connection_pool(cls):
-        """Get or create a connection pool instance"""
-        if cls._connection_pool is None:
-            cls._connection_pool = DatabaseConnectionPool(cls.db_file)
-        return cls._connection_pool
+    def acquire_writer(self):
+        """Take the single writer connection, waiting up to checkout_timeout"""
+        if not self._writer_lock.acquire(timeout=self.checkout_timeout):
+            self.timeouts += 1
+            raise PoolTimeout(f"Database writer not available after {self.checkout_timeout}s")
+
+        try:
+            if self._writer is None:
+                self._writer = self._connect()
+            elif not self._is_healthy(self._writer):
+                self._writer = self._replace(self._writer)
+        except sqlite3.Error:
+            self._writer_lock.release()
+            raise
+        self.writer_checkouts += 1
+        return self._writer
+
+    def release_writer(self):
+        """Give the writer connection back"""
+        self._writer_lock.release()
+
+    def get_stats(self):
+        """Get pool metrics for logging"""
+        with self._readers_available:
+            idle = len(self._idle_readers)
+            return {
+                "readers_open": self._open_readers,
+                "readers_idle": idle,
+                "readers_in_use": self._open_readers - idle,
+                "peak_readers_in_use": self.peak_readers_in_use,
+                "reader_checkouts": self.reader_checkouts,
+                "writer_checkouts": self.writer_checkouts,
+                "writer_busy": self._writer_lock.locked(),
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "replaced": self.replaced
+            }
+
+    def close(self):
+        """Close every idle connection and the writer"""
+        with self._readers_available:
+            for conn in self._idle_readers:
+                conn.close()
+            self._open_readers -= len(self._idle_readers)
+            self._idle_readers.clear()
+
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+# One pool per database file, shared by the bot and the web thread
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_connection_pool(db_file):
+    """Get or create the connection pool for a database file"""
+    with _pools_lock:
+        pool = _pools.get(db_file)
+        if pool is None:
+            pool = _pools[db_file] = DatabaseConnectionPool(db_file)
+        return pool
+
+def close_connection_pools():
+    """Close every connection pool, called once on shutdown"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
 
+# In-process map of server ID to channel ID, shared by the bot and the web thread.
+# set_server_channel writes through to it, so reads never touch the database.
+_server_channels = {}
+_server_channels_loaded = False
+_server_channels_lock = threading.Lock()
+
+class Database:
     def __init__(self, db_file=config.DATABASE_FILE):
-        """Initialize the database connection with connection pooling"""
+        """Initialize the database with the shared connection pool"""
         self.db_file = db_file
-        self.pool = DatabaseConnectionPool(db_file)
-        self.connect()
-        self.create_tables()
-
-    def connect(self):
-        """Connect to the SQLite database"""
-        try:
-            # Create a new connection for this thread
-            self.connection = sqlite3.connect(self.db_file)
-            self.connection.row_factory = sqlite3.Row  # Return rows as dictionaries
-            
-            # Initialize connection pool
-            self.pool = DatabaseConnectionPool(self.db_file)
-            
-            # Initialize connection pool
-            self.pool = DatabaseConnectionPool(self.db_file)
-            self.cursor = self.connection.cursor()
-        except sqlite3.Error as e:
-            print(f"Database connection error: {e}")
-
-    @property
-    def connection(self):
-        """Get the connection for the current thread"""
-        if not hasattr(self._local, 'connection'):
-            self._local.connection = None
-        return self._local.connection
-
-    @connection.setter
-    def connection(self, value):
-        """Set the connection for the current thread"""
-        self._local.connection = value
-
-    @property
-    def cursor(self):
-        """Get the cursor for the current thread"""
-        if not hasattr(self._local, 'cursor'):
-            self._local.cursor = None
-        return self._local.cursor
-
-    @cursor.setter
-    def cursor(self, value):
-        """Set the cursor for the current thread"""
-        self._local.cursor = value
-
-    def create_tables(self):
-        """Create necessary tables if they don't exist"""
-        try:
-            # Create players table with server_id
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS players (
+        self.pool = get_connection_pool(db_file)
+
+        # Writer connection held by the current thread for an open unit of work
+        self._local = threading.local()
+
+    @contextmanager
+    def _reader(self):
+        """Borrow a reader connection from the pool"""
+        conn = getattr(self._local, 'writer', None)
+        if conn is not None:
+            # Inside a unit of work, read through the writer to see its changes
+            yield conn
+            return
+
+        conn = self.pool.get_connection()
+        try:
+            yield conn
+        finally:
+            self.pool.release_connection(conn)
+
+    @contextmanager
+    def _writer(self):
+        """Borrow the writer connection and commit when the block exits
+
+        Inside a unit of work the block joins the open transaction instead.
+        """
+        conn = getattr(self._local, 'writer', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self.pool.acquire_writer()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.release_writer()
+
+    def _in_transaction(self):
+        """Check whether this thread has a unit of work open
+
+        Mutators normally report errors and return False, but inside a unit
+        of work they re-raise so transaction() rolls the whole block back.
+        """
+        return getattr(self._local, 'writer', None) is not None
+
+    @contextmanager
+    def transaction(self):
+        """Group several writes into a single commit
+
+        The writer connection is held for the whole block, mutators called
+        inside it join the transaction, and the unit of work is committed
+        (or rolled back on error) when it exits.
+        """
+        if self._in_transaction():
+            yield self
+            return
+
+        conn = self.pool.acquire_writer()
+        self._local.writer = conn
+        try:
+            yield self
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._local.writer = None
+            self.pool.release_writer()
+
+    def get_pool_stats(self):
+        """Get connection pool metrics for logging"""
+        return self.pool.get_stats()
+
+    def migrate(self):
+        """Bring the schema up to date, called once at startup
+
+        Each migration runs exactly once and the schema version is tracked
+        with PRAGMA user_version, so request paths never run DDL. A migration
+        and its version bump share one transaction, so a step that fails
+        partway through leaves nothing behind and is simply retried.
+        """
+        with self._writer() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            applied = False
+
+            for target_version, method_name in SCHEMA_MIGRATIONS:
+                if target_version <= version:
+                    continue
+
+                print(f"Applying schema migration {target_version} ({method_name})...")
+                # sqlite3 only opens transactions implicitly for DML, so DDL needs an explicit BEGIN
+                conn.execute('BEGIN')
+                try:
+                    getattr(self, method_name)(conn)
+                    conn.execute(f'PRAGMA user_version = {target_version}')
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Error applying schema migration {target_version}: {e}")
+                    raise
+                applied = True
+
+            # Give pages freed by the migrations (e.g. the legacy runs table) back to the filesystem
+            if applied and conn.execute('PRAGMA freelist_count').fetchone()[0]:
+                conn.execute('VACUUM')
+
+    def _create_base_tables(self, conn):
+        """Migration 1: players and server_channels tables"""
+        # Create players table with server_id
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS players (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                realm TEXT NOT NULL,
+                region TEXT NOT NULL DEFAULT 'us',
+                server_id TEXT NOT NULL,
+                last_run_id INTEGER DEFAULT 0,
+                last_checked TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(name, realm, region, server_id)
+            )
+        ''')
+
+        # Create server_channels table to store server-specific channel IDs
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS server_channels (
+                server_id TEXT PRIMARY KEY,
+                channel_id TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Check if we need to migrate existing data
+        columns = [column[1] for column in conn.execute("PRAGMA table_info(players)").fetchall()]
+
+        # If server_id column doesn't exist in an existing table, we need to migrate
+        if 'server_id' not in columns and len(columns) > 0:
+            print("Migrating existing players data to include server_id...")
+            # Create a temporary table with the new schema
+            conn.execute('''
+                CREATE TABLE players_new (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     name TEXT NOT NULL,
                     realm TEXT NOT NULL,
@@ -148,137 +511,432 @@ class Database:
                 )
             ''')
 
-            # Create runs table to store run history
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS runs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    run_id INTEGER NOT NULL,
-                    player_id INTEGER NOT NULL,
-                    dungeon TEXT NOT NULL,
-                    mythic_level INTEGER NOT NULL,
-                    completed_at TIMESTAMP NOT NULL,
-                    timed BOOLEAN NOT NULL,
-                    run_time_ms INTEGER NOT NULL,
-                    score REAL NOT NULL,
-                    url TEXT NOT NULL,
-                    run_data TEXT NOT NULL,
-                    FOREIGN KEY (player_id) REFERENCES players (id),
-                    UNIQUE(run_id, player_id)
-                )
+            # Copy data from old table to new table with a default server_id
+            conn.execute('''
+                INSERT INTO players_new (name, realm, region, server_id, last_run_id, last_checked)
+                SELECT name, realm, region, '0', last_run_id, last_checked FROM players
             ''')
 
-            # Create server_channels table to store server-specific channel IDs
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS server_channels (
-                    server_id TEXT PRIMARY KEY,
-                    channel_id TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            # Drop old table and rename new table
+            conn.execute('DROP TABLE players')
+            conn.execute('ALTER TABLE players_new RENAME TO players')
+
+            print("Migration completed.")
+
+    def _create_run_tables(self, conn):
+        """Migration 2: normalized run tables, replacing the per-player runs table"""
+        # Create keystone_runs table to store each run once, keyed by run ID
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS keystone_runs (
+                keystone_run_id INTEGER PRIMARY KEY,
+                season TEXT,
+                dungeon TEXT NOT NULL,
+                mythic_level INTEGER NOT NULL,
+                completed_at TIMESTAMP NOT NULL,
+                timed BOOLEAN NOT NULL,
+                run_time_ms INTEGER NOT NULL,
+                score REAL NOT NULL,
+                url TEXT NOT NULL,
+                run_data TEXT NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_keystone_runs_completed_at
+            ON keystone_runs (completed_at)
+        ''')
+
+        # Create run_participants table to store the roster of each run
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS run_participants (
+                keystone_run_id INTEGER NOT NULL,
+                character_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                realm TEXT,
+                region TEXT,
+                class TEXT,
+                spec TEXT,
+                role TEXT,
+                score REAL,
+                PRIMARY KEY (keystone_run_id, character_id),
+                FOREIGN KEY (keystone_run_id) REFERENCES keystone_runs (keystone_run_id)
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_run_participants_character
+            ON run_participants (character_id)
+        ''')
+
+        # Create player_runs table to link tracked players to their runs
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS player_runs (
+                player_id INTEGER NOT NULL,
+                keystone_run_id INTEGER NOT NULL,
+                PRIMARY KEY (player_id, keystone_run_id),
+                FOREIGN KEY (player_id) REFERENCES players (id),
+                FOREIGN KEY (keystone_run_id) REFERENCES keystone_runs (keystone_run_id)
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_player_runs_keystone_run
+            ON player_runs (keystone_run_id)
+        ''')
+
+        # Create run_payloads table to optionally keep raw run details, once per run
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS run_payloads (
+                keystone_run_id INTEGER PRIMARY KEY,
+                payload BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        self._migrate_legacy_runs(conn)
+
+    def _create_lookup_indexes(self, conn):
+        """Migration 3: index-backed player lookups and run history queries"""
+        # add_player stores names lowercased, so lookups compare columns directly
+        # and use the UNIQUE(name, realm, region, server_id) index
+        conn.execute('''
+            UPDATE OR IGNORE players
+            SET name = LOWER(name), realm = LOWER(realm), region = LOWER(region)
+        ''')
+
+        # Per-guild player lists and run history start from players.server_id
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_players_server
+            ON players (server_id)
+        ''')
+
+    def _add_check_schedule(self, conn):
+        """Migration 4: per-player polling schedule seeded from run history"""
+        conn.execute('ALTER TABLE players ADD COLUMN next_check_at TIMESTAMP')
+        conn.execute('ALTER TABLE players ADD COLUMN check_interval INTEGER')
+
+        # Start each player at the interval its last completed run suggests,
+        # next_check_at stays NULL so everyone is checked once after upgrading
+        rows = conn.execute('''
+            SELECT players.id, MAX(keystone_runs.completed_at) AS last_run_at
+            FROM players
+            LEFT JOIN player_runs ON player_runs.player_id = players.id
+            LEFT JOIN keystone_runs ON keystone_runs.keystone_run_id = player_runs.keystone_run_id
+            GROUP BY players.id
+        ''').fetchall()
+        now = scheduler.utc_now()
+        conn.executemany(
+            'UPDATE players SET check_interval = ? WHERE id = ?',
+            [(scheduler.activity_ceiling(row['last_run_at'], now), row['id']) for row in rows]
+        )
+
+    def _add_run_watermark(self, conn):
+        """Migration 5: completion time of each player's last seen run, next to last_run_id"""
+        conn.execute('ALTER TABLE players ADD COLUMN last_run_completed_at TIMESTAMP')
+
+        # Players whose last run is stored get a full watermark, the rest keep
+        # comparing run IDs until their next new run
+        conn.execute('''
+            UPDATE players SET last_run_completed_at = (
+                SELECT completed_at FROM keystone_runs
+                WHERE keystone_runs.keystone_run_id = players.last_run_id
+            )
+        ''')
+
+    def _add_character_id(self, conn):
+        """Migration 6: stable Raider.io character ID, learned from the next run's roster"""
+        conn.execute('ALTER TABLE players ADD COLUMN character_id INTEGER')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_players_character_id
+            ON players (character_id)
+        ''')
+
+    def _add_profile_fingerprint(self, conn):
+        """Migration 7: fingerprint of the recent runs each player was last checked against"""
+        conn.execute('ALTER TABLE players ADD COLUMN profile_fingerprint TEXT')
+
+    def _add_realm_slug(self, conn):
+        """Migration 8: Raider.io realm slug, learned from the next profile fetch"""
+        conn.execute('ALTER TABLE players ADD COLUMN realm_slug TEXT')
+
+    def check_query_plans(self):
+        """Warn about hot queries that would scan a whole table, returns their names"""
+        offenders = []
+        with self._reader() as conn:
+            for name, sql, params in HOT_QUERIES:
+                plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+                scans = [row['detail'] for row in plan if row['detail'].startswith('SCAN')]
+                if scans:
+                    print(f"Warning: query '{name}' is not index-backed: {'; '.join(scans)}")
+                    offenders.append(name)
+        return offenders
+
+    def _migrate_legacy_runs(self, conn):
+        """Move rows from the old per-player runs table into the normalized tables"""
+        if not conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='runs'").fetchone():
+            return
+
+        rows = conn.execute('''
+            SELECT run_id, player_id, dungeon, mythic_level, completed_at, timed,
+                   run_time_ms, score, url, run_data
+            FROM runs ORDER BY id
+        ''').fetchall()
+        print(f"Migrating {len(rows)} stored runs to the normalized run tables...")
+
+        for row in rows:
+            try:
+                run_data = json.loads(row['run_data'])
+            except ValueError:
+                run_data = {}
+
+            # Older rows hold the full run-details payload, so compact them on the way
+            if config.STORE_RAW_RUN_PAYLOADS and len(row['run_data']) > COMPACT_RUN_DATA_THRESHOLD:
+                self._store_run_payload(conn, row['run_id'], run_data)
+
+            self._insert_keystone_run(
+                conn, row['run_id'], row['dungeon'], row['mythic_level'], row['completed_at'],
+                row['timed'], row['run_time_ms'], row['score'], row['url'],
+                compact_run_data(run_data)
+            )
+            conn.execute('''
+                INSERT OR IGNORE INTO player_runs (player_id, keystone_run_id)
+                VALUES (?, ?)
+            ''', (row['player_id'], row['run_id']))
+
+        conn.execute('DROP TABLE runs')
+        print("Run migration completed.")
+
+    def _insert_keystone_run(self, conn, run_id, dungeon, mythic_level, completed_at,
+                             timed, run_time_ms, score, url, record):
+        """Insert a keystone run and its roster once, returns True if the run is new"""
+        season = record.get("season")
+        if not season and "/season-" in url:
+            season = url.split("/season-", 1)[1].split("/", 1)[0]
+            season = f"season-{season}"
+
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO keystone_runs
+            (keystone_run_id, season, dungeon, mythic_level, completed_at, timed,
+            run_time_ms, score, url, run_data)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (run_id, season, dungeon, mythic_level, completed_at, timed,
+             run_time_ms, score, url, json.dumps(record)))
+        if cursor.rowcount == 0:
+            return False
+
+        participants = []
+        for member in record.get("roster", []):
+            character = member["character"]
+            if not character.get("id"):
+                continue
+            participants.append((
+                run_id, character["id"], character.get("name", "Unknown"),
+                character["realm"].get("slug"), character["region"].get("slug"),
+                character["class"].get("name"), character["spec"].get("name"),
+                character["spec"].get("role"), member["ranks"].get("score")
+            ))
+        conn.executemany('''
+            INSERT OR IGNORE INTO run_participants
+            (keystone_run_id, character_id, name, realm, region, class, spec, role, score)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', participants)
+        return True
 
-            # Debug: Check if server_channels table exists
-            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='server_channels'")
-            if self.cursor.fetchone():
-                print("server_channels table exists")
-            else:
-                print("server_channels table does NOT exist")
-
-            # Check if we need to migrate existing data
-            self.cursor.execute("PRAGMA table_info(players)")
-            columns = [column[1] for column in self.cursor.fetchall()]
-
-            # If server_id column doesn't exist in an existing table, we need to migrate
-            if 'server_id' not in columns and len(columns) > 0:
-                print("Migrating existing players data to include server_id...")
-                # Create a temporary table with the new schema
-                self.cursor.execute('''
-                    CREATE TABLE players_new (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        realm TEXT NOT NULL,
-                        region TEXT NOT NULL DEFAULT 'us',
-                        server_id TEXT NOT NULL,
-                        last_run_id INTEGER DEFAULT 0,
-                        last_checked TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        UNIQUE(name, realm, region, server_id)
-                    )
-                ''')
-
-                # Copy data from old table to new table with a default server_id
-                self.cursor.execute('''
-                    INSERT INTO players_new (name, realm, region, server_id, last_run_id, last_checked)
-                    SELECT name, realm, region, '0', last_run_id, last_checked FROM players
-                ''')
-
-                # Drop old table and rename new table
-                self.cursor.execute('DROP TABLE players')
-                self.cursor.execute('ALTER TABLE players_new RENAME TO players')
-
-                print("Migration completed.")
-
-            self.connection.commit()
+    def _store_run_payload(self, conn, keystone_run_id, run_data):
+        """Store a compressed raw run-details payload, once per keystone run"""
+        payload = zlib.compress(json.dumps(run_data).encode('utf-8'))
+        conn.execute('''
+            INSERT OR IGNORE INTO run_payloads (keystone_run_id, payload)
+            VALUES (?, ?)
+        ''', (keystone_run_id, payload))
+
+    def get_run_payload(self, keystone_run_id):
+        """Get the raw run-details payload stored for a keystone run"""
+        try:
+            with self._reader() as conn:
+                result = conn.execute(
+                    'SELECT payload FROM run_payloads WHERE keystone_run_id = ?',
+                    (keystone_run_id,)
+                ).fetchone()
+            if result:
+                return json.loads(zlib.decompress(result['payload']).decode('utf-8'))
+            return None
         except sqlite3.Error as e:
-            print(f"Error creating tables: {e}")
+            print(f"Error getting run payload: {e}")
+            return None
 
-    def add_player(self, name, realm, region='us', server_id='0'):
+    def add_player(self, name, realm, region='us', server_id='0', character_id=None):
         """Add a player to track"""
         try:
-            self.cursor.execute('''
-                INSERT OR IGNORE INTO players (name, realm, region, server_id, last_checked)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (name.lower(), realm.lower(), region.lower(), str(server_id), datetime.now()))
-            self.connection.commit()
-            return self.cursor.rowcount > 0
+            with self._writer() as conn:
+                cursor = conn.execute('''
+                    INSERT OR IGNORE INTO players (name, realm, region, server_id, character_id, last_checked)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (name.lower(), realm.lower(), region.lower(), str(server_id), character_id, datetime.now()))
+            return cursor.rowcount > 0
         except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
             print(f"Error adding player: {e}")
             return False
 
     def remove_player(self, name, realm, region='us', server_id='0'):
         """Remove a player from tracking"""
         try:
-            self.cursor.execute('''
-                DELETE FROM players
-                WHERE LOWER(name) = ? AND LOWER(realm) = ? AND LOWER(region) = ? AND server_id = ?
-            ''', (name.lower(), realm.lower(), region.lower(), str(server_id)))
-            self.connection.commit()
-            return self.cursor.rowcount > 0
+            with self._writer() as conn:
+                params = (name.lower(), realm.lower(), region.lower(), str(server_id))
+                conn.execute(REMOVE_PLAYER_RUNS_SQL, params)
+                cursor = conn.execute(REMOVE_PLAYER_SQL, params)
+            return cursor.rowcount > 0
         except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
             print(f"Error removing player: {e}")
             return False
 
     def get_all_players(self):
-        """Get all tracked players"""
+        """Get all tracked players, None if the read failed"""
         try:
-            self.cursor.execute('SELECT * FROM players')
-            return self.cursor.fetchall()
+            with self._reader() as conn:
+                return conn.execute('SELECT * FROM players').fetchall()
         except sqlite3.Error as e:
             print(f"Error getting players: {e}")
-            return []
+            return None
+
+    def get_players_by_character(self, name, realm, region='us'):
+        """Get the tracked rows of a character whose Raider.io ID is not known yet
+
+        realm matches either the learned realm slug or the realm as typed.
+        Returns None if the read failed, so callers can tell it from an untracked character.
+        """
+        try:
+            with self._reader() as conn:
+                return conn.execute(
+                    PLAYERS_BY_CHARACTER_SQL, (name.lower(), region.lower(), realm.lower(), realm.lower())
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error getting players for {name}-{realm}: {e}")
+            return None
+
+    def get_players_by_character_id(self, character_id):
+        """Get every tracked player row for a Raider.io character ID, None if the read failed"""
+        try:
+            with self._reader() as conn:
+                return conn.execute(PLAYERS_BY_CHARACTER_ID_SQL, (character_id,)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error getting players for character {character_id}: {e}")
+            return None
+
+    def set_character_id(self, player_ids, character_id):
+        """Store the Raider.io character ID on the given player rows"""
+        try:
+            with self._writer() as conn:
+                conn.executemany('''
+                    UPDATE players SET character_id = ? WHERE id = ?
+                ''', [(character_id, player_id) for player_id in player_ids])
+            return True
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Error setting character ID {character_id}: {e}")
+            return False
+
+    def set_realm_slug(self, player_ids, realm_slug):
+        """Store the Raider.io realm slug on the given player rows
+
+        A row without a character ID takes the ID already known for the same
+        name and realm slug, so every row of a character is checked together.
+        """
+        try:
+            with self._writer() as conn:
+                conn.executemany('''
+                    UPDATE players SET realm_slug = ?, character_id = COALESCE(character_id, (
+                        SELECT other.character_id FROM players AS other
+                        WHERE other.name = players.name AND other.region = players.region
+                        AND other.realm_slug = ? AND other.character_id IS NOT NULL
+                        LIMIT 1
+                    ))
+                    WHERE id = ?
+                ''', [(realm_slug, realm_slug, player_id) for player_id in player_ids])
+            return True
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Error setting realm slug {realm_slug}: {e}")
+            return False
+
+    def rename_character(self, character_id, name, realm_slug, region):
+        """Follow a character rename or realm transfer, returns (rows moved, rows merged)
+
+        Realms stay as users typed them, so /untrack keeps matching, and only
+        the name and realm slug follow the character. A server left with two
+        rows for the character keeps the one under the new name, which takes
+        over the other row's run history.
+        """
+        name, realm_slug, region = name.lower(), realm_slug.lower(), region.lower()
+        try:
+            with self._writer() as conn:
+                cursor = conn.execute('''
+                    UPDATE OR IGNORE players SET name = ?, realm_slug = ?, region = ?
+                    WHERE character_id = ?
+                ''', (name, realm_slug, region, character_id))
+                moved = cursor.rowcount
+
+                # Rows that could not be renamed clash with a row already tracking the new name
+                rows = conn.execute('''
+                    SELECT id, server_id FROM players
+                    WHERE character_id = ? OR (name = ? AND region = ? AND (
+                        realm_slug = ? OR realm IN (SELECT realm FROM players WHERE character_id = ?)
+                    ))
+                    ORDER BY name != ?, id
+                ''', (character_id, name, region, realm_slug, character_id, name)).fetchall()
+
+                kept = {}
+                merged = 0
+                for row in rows:
+                    current_id = kept.setdefault(row['server_id'], row['id'])
+                    if current_id == row['id']:
+                        continue
+                    conn.execute('''
+                        INSERT OR IGNORE INTO player_runs (player_id, keystone_run_id)
+                        SELECT ?, keystone_run_id FROM player_runs WHERE player_id = ?
+                    ''', (current_id, row['id']))
+                    conn.execute('DELETE FROM player_runs WHERE player_id = ?', (row['id'],))
+                    conn.execute('DELETE FROM players WHERE id = ?', (row['id'],))
+                    merged += 1
+
+                conn.executemany('''
+                    UPDATE players SET character_id = ?, realm_slug = ? WHERE id = ?
+                ''', [(character_id, realm_slug, player_id) for player_id in kept.values()])
+            return moved, merged
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Error renaming character {character_id}: {e}")
+            return 0, 0
 
     def get_players_by_server(self, server_id):
         """Get all tracked players for a specific server"""
         try:
-            self.cursor.execute('SELECT * FROM players WHERE server_id = ?', (str(server_id),))
-            return self.cursor.fetchall()
+            with self._reader() as conn:
+                return conn.execute(PLAYERS_BY_SERVER_SQL, (str(server_id),)).fetchall()
         except sqlite3.Error as e:
             print(f"Error getting players for server {server_id}: {e}")
             return []
 
-    def update_player_last_run(self, player_id, run_id, timestamp=None):
-        """Update the last run ID for a player"""
+    def update_player_last_run(self, player_id, run_id, completed_at=None, timestamp=None):
+        """Move a player's watermark to the given run and its completion time"""
         if timestamp is None:
             timestamp = datetime.now()
 
         try:
-            self.cursor.execute('''
-                UPDATE players
-                SET last_run_id = ?, last_checked = ?
-                WHERE id = ?
-            ''', (run_id, timestamp, player_id))
-            self.connection.commit()
+            with self._writer() as conn:
+                conn.execute('''
+                    UPDATE players
+                    SET last_run_id = ?, last_run_completed_at = ?, last_checked = ?
+                    WHERE id = ?
+                ''', (run_id, completed_at or None, timestamp, player_id))
             return True
         except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
             print(f"Error updating player last run: {e}")
             return False
 
@@ -288,46 +946,167 @@ class Database:
             timestamp = datetime.now()
 
         try:
-            self.cursor.execute('''
-                UPDATE players
-                SET last_checked = ?
-                WHERE id = ?
-            ''', (timestamp, player_id))
-            self.connection.commit()
+            with self._writer() as conn:
+                conn.execute('''
+                    UPDATE players
+                    SET last_checked = ?
+                    WHERE id = ?
+                ''', (timestamp, player_id))
             return True
         except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
             print(f"Error updating player last checked: {e}")
             return False
 
+    def update_players_last_checked(self, player_ids, timestamp=None):
+        """Update the last checked timestamp for many players in one statement"""
+        if not player_ids:
+            return True
+
+        if timestamp is None:
+            timestamp = datetime.now()
+
+        try:
+            with self._writer() as conn:
+                conn.executemany('''
+                    UPDATE players
+                    SET last_checked = ?
+                    WHERE id = ?
+                ''', [(timestamp, player_id) for player_id in player_ids])
+            return True
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Error updating players last checked: {e}")
+            return False
+
+    def update_players_schedule(self, schedules):
+        """Store the polling schedule for many players, given (player_id, interval, next_check_at)"""
+        if not schedules:
+            return True
+
+        try:
+            with self._writer() as conn:
+                conn.executemany('''
+                    UPDATE players
+                    SET check_interval = ?, next_check_at = ?
+                    WHERE id = ?
+                ''', [(interval, next_check_at, player_id)
+                      for player_id, interval, next_check_at in schedules])
+            return True
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Error updating players schedule: {e}")
+            return False
+
+    def update_players_fingerprint(self, fingerprints):
+        """Store the profile fingerprint for many players, given (player_id, fingerprint)"""
+        if not fingerprints:
+            return True
+
+        try:
+            with self._writer() as conn:
+                conn.executemany('''
+                    UPDATE players
+                    SET profile_fingerprint = ?
+                    WHERE id = ?
+                ''', [(fingerprint, player_id) for player_id, fingerprint in fingerprints])
+            return True
+        except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
+            print(f"Error updating players fingerprint: {e}")
+            return False
+
     def add_run(self, player_id, run_id, dungeon, mythic_level, completed_at,
                 timed, run_time_ms, score, url, run_data):
-        """Add a new run to the database"""
-        try:
-            # Convert run_data to JSON string if it's a dict
-            if isinstance(run_data, dict):
-                run_data = json.dumps(run_data)
-
-            self.cursor.execute('''
-                INSERT OR IGNORE INTO runs
-                (run_id, player_id, dungeon, mythic_level, completed_at, timed,
-                run_time_ms, score, url, run_data)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (run_id, player_id, dungeon, mythic_level, completed_at,
-                 timed, run_time_ms, score, url, run_data))
-            self.connection.commit()
-            return self.cursor.rowcount > 0
+        """Add a new run to the database and link it to a tracked player"""
+        try:
+            if isinstance(run_data, str):
+                run_data = json.loads(run_data)
+
+            with self._writer() as conn:
+                # Store only the compact run record, the raw payload is optional
+                if config.STORE_RAW_RUN_PAYLOADS and run_data.get("roster"):
+                    self._store_run_payload(conn, run_id, run_data)
+
+                # The run itself is stored once, however many tracked players were in it
+                self._insert_keystone_run(
+                    conn, run_id, dungeon, mythic_level, completed_at, timed,
+                    run_time_ms, score, url, compact_run_data(run_data)
+                )
+
+                cursor = conn.execute('''
+                    INSERT OR IGNORE INTO player_runs (player_id, keystone_run_id)
+                    VALUES (?, ?)
+                ''', (player_id, run_id))
+            return cursor.rowcount > 0
         except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
             print(f"Error adding run: {e}")
             return False
 
+    def get_linked_runs(self, player_ids, run_ids):
+        """Get which of the given runs are already linked to which players, as (player_id, run_id) pairs"""
+        if not player_ids or not run_ids:
+            return set()
+
+        try:
+            with self._reader() as conn:
+                rows = conn.execute(
+                    linked_runs_sql(len(player_ids), len(run_ids)), (*player_ids, *run_ids)
+                ).fetchall()
+            return {(row['player_id'], row['keystone_run_id']) for row in rows}
+        except sqlite3.Error as e:
+            print(f"Error getting linked runs: {e}")
+            return set()
+
+    def get_player_runs(self, player_id, limit=20):
+        """Get the most recent runs for a tracked player"""
+        try:
+            with self._reader() as conn:
+                return conn.execute(PLAYER_RUNS_SQL, (player_id, limit)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error getting runs for player {player_id}: {e}")
+            return []
+
+    def get_server_runs(self, server_id, since=None):
+        """Get the runs of every player tracked in a server, optionally since a timestamp"""
+        try:
+            with self._reader() as conn:
+                return conn.execute(SERVER_RUNS_SQL, (str(server_id), since or '')).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error getting runs for server {server_id}: {e}")
+            return []
+
+    def get_run_participants(self, keystone_run_id):
+        """Get the roster of a stored keystone run"""
+        try:
+            with self._reader() as conn:
+                return conn.execute(RUN_PARTICIPANTS_SQL, (keystone_run_id,)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error getting participants for run {keystone_run_id}: {e}")
+            return []
+
+    def get_player_by_id(self, player_id):
+        """Get a player by ID"""
+        try:
+            with self._reader() as conn:
+                return conn.execute(PLAYER_BY_ID_SQL, (player_id,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error getting player {player_id}: {e}")
+            return None
+
     def get_player_by_name_realm(self, name, realm, region='us', server_id='0'):
         """Get a player by name and realm"""
         try:
-            self.cursor.execute('''
-                SELECT * FROM players
-                WHERE LOWER(name) = ? AND LOWER(realm) = ? AND LOWER(region) = ? AND server_id = ?
-            ''', (name.lower(), realm.lower(), region.lower(), str(server_id)))
-            return self.cursor.fetchone()
+            with self._reader() as conn:
+                return conn.execute(
+                    PLAYER_BY_NAME_REALM_SQL, (name.lower(), realm.lower(), region.lower(), str(server_id))
+                ).fetchone()
         except sqlite3.Error as e:
             print(f"Error getting player: {e}")
             return None
@@ -335,140 +1114,117 @@ class Database:
     def set_server_channel(self, server_id, channel_id):
         """Set or update the channel ID for a server"""
         try:
-            print(f"Setting channel {channel_id} for server {server_id}")
-
-            # Debug: Check if server_channels table exists
-            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='server_channels'")
-            if self.cursor.fetchone():
-                print("server_channels table exists in set_server_channel")
-            else:
-                print("server_channels table does NOT exist in set_server_channel")
-                # Try to create the table if it doesn't exist
-                self.cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS server_channels (
-                        server_id TEXT PRIMARY KEY,
-                        channel_id TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                self.connection.commit()
-                print("Created server_channels table")
-
-            # Check if server already exists
-            self.cursor.execute('SELECT * FROM server_channels WHERE server_id = ?', (str(server_id),))
-            existing = self.cursor.fetchone()
-
-            if existing:
-                print(f"Updating existing record for server {server_id}")
-                # Update existing record
-                self.cursor.execute('''
-                    UPDATE server_channels
-                    SET channel_id = ?, updated_at = ?
-                    WHERE server_id = ?
-                ''', (str(channel_id), datetime.now(), str(server_id)))
-            else:
-                print(f"Inserting new record for server {server_id}")
-                # Insert new record
-                self.cursor.execute('''
+            with self._writer() as conn:
+                conn.execute('''
                     INSERT INTO server_channels (server_id, channel_id)
                     VALUES (?, ?)
-                ''', (str(server_id), str(channel_id)))
+                    ON CONFLICT(server_id) DO UPDATE SET
+                        channel_id = excluded.channel_id,
+                        updated_at = ?
+                ''', (str(server_id), str(channel_id), datetime.now()))
 
-            self.connection.commit()
-
-            # Verify the record was saved
-            self.cursor.execute('SELECT channel_id FROM server_channels WHERE server_id = ?', (str(server_id),))
-            result = self.cursor.fetchone()
-            if result:
-                print(f"Verified record saved: channel_id = {result['channel_id']} for server_id = {server_id}")
-            else:
-                print(f"Failed to verify record for server_id = {server_id}")
+            # Write through to the in-memory map so the bot sees web changes immediately
+            with _server_channels_lock:
+                _server_channels[str(server_id)] = str(channel_id)
 
             return True
         except sqlite3.Error as e:
+            if self._in_transaction():
+                raise
             print(f"Error setting server channel: {e}")
             return False
 
     def get_server_channel(self, server_id):
-        """Get the channel ID for a server"""
-        try:
-            print(f"Getting channel for server {server_id}")
-
-            # Debug: Check if server_channels table exists
-            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='server_channels'")
-            if self.cursor.fetchone():
-                print("server_channels table exists in get_server_channel")
-            else:
-                print("server_channels table does NOT exist in get_server_channel")
-                return None
-
-            self.cursor.execute('SELECT channel_id FROM server_channels WHERE server_id = ?', (str(server_id),))
-            result = self.cursor.fetchone()
+        """Get the channel ID for a server from the in-memory map"""
+        if not _server_channels_loaded:
+            self.load_server_channels()
+        return _server_channels.get(str(server_id))
 
-            if result:
-                print(f"Found channel_id {result['channel_id']} for server {server_id}")
-                return result['channel_id']
-            else:
-                print(f"No channel_id found for server {server_id}")
-                return None
+    def load_server_channels(self):
+        """Load every server channel mapping into the in-memory map"""
+        global _server_channels_loaded
+        try:
+            with self._reader() as conn:
+                rows = conn.execute('SELECT server_id, channel_id FROM server_channels').fetchall()
         except sqlite3.Error as e:
-            print(f"Error getting server channel: {e}")
-            return None
+            print(f"Error loading server channels: {e}")
+            return
+
+        with _server_channels_lock:
+            _server_channels.clear()
+            for row in rows:
+                _server_channels[row['server_id']] = row['channel_id']
+            _server_channels_loaded = True
+        print(f"Loaded {len(rows)} server channel mappings")
 
     def get_all_server_channels(self):
         """Get all server channel mappings"""
         try:
-            self.cursor.execute('SELECT * FROM server_channels')
-            return self.cursor.fetchall()
+            with self._reader() as conn:
+                return conn.execute('SELECT * FROM server_channels').fetchall()
         except sqlite3.Error as e:
             print(f"Error getting server channels: {e}")
             return []
 
-    def _create_indexes(self):
-        """Create necessary indexes for performance optimization"""
-        
-        # Create indexes for player lookup queries
-        self.connection.execute("""
-            CREATE INDEX IF NOT EXISTS idx_players_name_realm_region_server
-            ON players (name, realm, region, server_id)
-        """)
-        
-        # Create index for run tracking queries
-        self.connection.execute("""
-            CREATE INDEX IF NOT EXISTS idx_runs_player_dungeon
-            ON runs (player_id, dungeon)
-        """)
-        
-        # Create index for server channel lookups
-        self.connection.execute("""
-            CREATE INDEX IF NOT EXISTS idx_server_channels_server_id
-            ON server_channels (server_id)
-        """)
-        try:
-            # Index for player lookup by name/realm/region
-            self.cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_players_name_realm_region
-                ON players (LOWER(name), LOWER(realm), LOWER(region))
-            ''')
-            
-            # Index for run queries by dungeon and mythic_level
-            self.cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_runs_dungeon_mythic_level
-                ON runs (dungeon, mythic_level)
-            ''')
-            
-            # Index for server channel lookups
-            self.cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_server_channels_server_id
-                ON server_channels (server_id)
-            ''')
-            
-            self.connection.commit()
-        except sqlite3.Error as e:
-            print(f"Error creating indexes: {e}")
+    def close(self):
+        """Release this instance, the shared pool stays open for other instances"""
+        self._local = threading.local()
+
+class AsyncDatabase:
+    """Runs Database calls on a dedicated thread so they never block the event loop
+
+    Every Database method is available as a coroutine with the same name and
+    arguments. Calls are executed one at a time on a single worker thread that
+    borrows connections from the shared pool, and at most max_pending calls may
+    be queued before callers wait for a free slot.
+    """
+
+    def __init__(self, db_file=config.DATABASE_FILE, max_pending=config.DATABASE_QUEUE_SIZE):
+        """Create the worker thread and open the database on it"""
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database')
+        self._db = self._executor.submit(Database, db_file).result()
+        self._executor.submit(self._db.migrate).result()
+        self._executor.submit(self._db.check_query_plans).result()
+        self._executor.submit(self._db.load_server_channels).result()
+        self._max_pending = max_pending
+        self._slots = None
+
+    async def run(self, func, *args, **kwargs):
+        """Run a callable on the database thread and await its result"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_pending)
+
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def run_transaction(self, func):
+        """Run func(db) on the database thread inside a single transaction"""
+        def unit_of_work():
+            with self._db.transaction():
+                return func(self._db)
+
+        return await self.run(unit_of_work)
+
+    async def get_server_channel(self, server_id):
+        """Get the channel ID for a server without a database round-trip"""
+        return self._db.get_server_channel(server_id)
+
+    def __getattr__(self, name):
+        """Expose each Database method as a coroutine"""
+        attr = getattr(self._db, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        call.__name__ = name
+        call.__doc__ = attr.__doc__
+        return call
 
     def close(self):
-        """Close the database connection"""
-        if self.connection:
-            self.connection.close()
+        """Stop the worker thread and close the connection pools"""
+        self._executor.submit(self._db.close).result()
+        self._executor.shutdown(wait=True)
+        close_connection_pools()
@@ -0,0 +1,213 @@
+"""Local stand-in for the Raider.io API, for benchmarks and load tests
+
+Usage: python fake_raiderio.py [--port 8765] [--latency 0.1] [--error-rate 0.01] [--throttle-rate 0.01]
+
+Serves deterministic character profiles for any name, the current season's
+static data from the bundled dungeon_cache.json, and answers every
+run-details request with the bundled apireply.txt, so a full sweep can be
+exercised without touching the real API. Responses can be delayed, fail with
+5xx errors or be throttled with 429 and Retry-After. Point the bot at it with
+RAIDERIO_API_URL=http://127.0.0.1:8765/api/v1.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+API_REPLY_FILE = os.path.join(BASE_DIR, "apireply.txt")
+DUNGEON_CACHE_FILE = os.path.join(BASE_DIR, "dungeon_cache.json")
+
+# Season the generated runs belong to, matching the bot's season filter
+SEASON = "season-tww-3"
+SEASON_SHORT = "TWW3"
+
+# Profile sections only included when asked for in the fields parameter
+OPTIONAL_PROFILE_FIELDS = ("mythic_plus_recent_runs", "mythic_plus_scores_by_season")
+
+# Status codes returned for injected server errors
+ERROR_STATUSES = (500, 502, 503)
+
+def load_dungeons():
+    """Get the dungeon entries from the bundled dungeon cache"""
+    with open(DUNGEON_CACHE_FILE) as f:
+        dungeons = json.load(f).get("dungeons", {})
+    return [{"name": name, **info} for name, info in dungeons.items()]
+
+def character_seed(name, realm, region):
+    """Get a stable number for a character, so profiles do not change between requests"""
+    digest = hashlib.sha1(f"{region}/{realm}/{name}".lower().encode("utf-8")).hexdigest()
+    return int(digest[:8], 16)
+
+def make_run(seed, index, dungeons, now):
+    """Build one entry of mythic_plus_recent_runs"""
+    dungeon = dungeons[(seed + index) % len(dungeons)]
+    run_id = seed * 100 + index
+    level = 2 + (seed + index) % 14
+    par_time_ms = (dungeon.get("keystone_timer_seconds") or 1800) * 1000
+    clear_time_ms = int(par_time_ms * (0.8 + ((seed >> index) % 40) / 100))
+    return {
+        "dungeon": dungeon["name"],
+        "short_name": dungeon.get("short_name"),
+        "mythic_level": level,
+        "completed_at": (now - timedelta(hours=index * 3 + seed % 3)).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "clear_time_ms": clear_time_ms,
+        "keystone_run_id": run_id,
+        "par_time_ms": par_time_ms,
+        "num_keystone_upgrades": 1 if clear_time_ms <= par_time_ms else 0,
+        "map_challenge_mode_id": dungeon.get("challenge_mode_id"),
+        "zone_id": dungeon.get("id"),
+        "score": 150 + level * 15,
+        "affixes": [],
+        "url": f"https://raider.io/mythic-plus-runs/{SEASON}/{run_id}-{level}-{dungeon.get('slug')}"
+    }
+
+def make_profile(name, realm, region, dungeons, runs_per_profile, now=None):
+    """Build a character profile with recent runs"""
+    now = now or datetime.now(timezone.utc)
+    seed = character_seed(name, realm, region)
+    return {
+        "name": name.title(),
+        "race": "Night Elf",
+        "class": "Druid",
+        "active_spec_name": "Restoration",
+        "active_spec_role": "HEALING",
+        "region": region,
+        "realm": realm.title(),
+        "profile_url": f"https://raider.io/characters/{region}/{realm}/{name}",
+        "mythic_plus_recent_runs": [make_run(seed, index, dungeons, now) for index in range(runs_per_profile)],
+        "mythic_plus_scores_by_season": [{"season": SEASON, "scores": {"all": 2500.0}}]
+    }
+
+def make_static_data(dungeons):
+    """Build a mythic-plus/static-data reply for the current season"""
+    return {
+        "seasons": [{
+            "slug": SEASON,
+            "name": "TWW Season 3",
+            "short_name": SEASON_SHORT,
+            "dungeons": [dict(dungeon) for dungeon in dungeons]
+        }]
+    }
+
+def error_response(status, message, headers=None):
+    """Build an error reply shaped like the real API's"""
+    return web.json_response(
+        {"statusCode": status, "error": message, "message": message},
+        status=status, headers=headers
+    )
+
+def create_app(runs_per_profile=10, latency=0.0, jitter=0.0, error_rate=0.0,
+               throttle_rate=0.0, retry_after=1, seed=None, etags=True):
+    """Create the fake API application, mounted under /api/v1
+
+    latency and jitter are in seconds, error_rate and throttle_rate are the
+    fractions of requests answered with a 5xx error or a 429. seed makes the
+    injected failures reproducible. Profiles stay the same for the life of
+    the app and, with etags, carry an ETag and honour If-None-Match.
+    """
+    dungeons = load_dungeons()
+    generated_at = datetime.now(timezone.utc)
+    static_data = make_static_data(dungeons)
+    with open(API_REPLY_FILE, "rb") as f:
+        run_details_body = f.read()
+
+    rng = random.Random(seed)
+    app = web.Application()
+    app["stats"] = {"profile": 0, "not_modified": 0, "run_details": 0, "static_data": 0, "errors": 0, "throttled": 0}
+
+    @web.middleware
+    async def simulate_network(request, handler):
+        """Delay every request and inject failures before it reaches its handler"""
+        delay = latency + (rng.uniform(0, jitter) if jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        roll = rng.random()
+        if roll < throttle_rate:
+            app["stats"]["throttled"] += 1
+            return error_response(429, "Too Many Requests", {"Retry-After": str(retry_after)})
+        if roll < throttle_rate + error_rate:
+            app["stats"]["errors"] += 1
+            status = rng.choice(ERROR_STATUSES)
+            return error_response(status, "Simulated server error")
+        return await handler(request)
+
+    app.middlewares.append(simulate_network)
+
+    async def character_profile(request):
+        app["stats"]["profile"] += 1
+        query = request.query
+        if not query.get("name") or not query.get("realm"):
+            return error_response(400, "Bad Request")
+        profile = make_profile(
+            query["name"], query["realm"], query.get("region", "us"), dungeons, runs_per_profile, generated_at
+        )
+        fields = {field.split(":")[0] for field in query.get("fields", "").split(",") if field}
+        body = json.dumps({
+            key: value for key, value in profile.items()
+            if key not in OPTIONAL_PROFILE_FIELDS or key in fields
+        })
+        if not etags:
+            return web.Response(text=body, content_type="application/json")
+
+        etag = f'"{hashlib.sha1(body.encode("utf-8")).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            app["stats"]["not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(text=body, content_type="application/json", headers={"ETag": etag})
+
+    async def run_details(request):
+        app["stats"]["run_details"] += 1
+        if not request.query.get("id"):
+            return error_response(400, "Bad Request")
+        return web.Response(body=run_details_body, content_type="application/json")
+
+    async def mythic_plus_static_data(request):
+        app["stats"]["static_data"] += 1
+        if not request.query.get("expansion_id"):
+            return error_response(400, "Bad Request")
+        return web.json_response(static_data)
+
+    app.router.add_get("/api/v1/characters/profile", character_profile)
+    app.router.add_get("/api/v1/mythic-plus/run-details", run_details)
+    app.router.add_get("/api/v1/mythic-plus/static-data", mythic_plus_static_data)
+    return app
+
+async def start_server(host="127.0.0.1", port=8765, **app_options):
+    """Start the fake API in the running event loop, returns the AppRunner"""
+    runner = web.AppRunner(create_app(**app_options), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+def main():
+    """Run the fake API in the foreground until interrupted"""
+    parser = argparse.ArgumentParser(description="Local stand-in for the Raider.io API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--runs-per-profile", type=int, default=10, help="recent runs in each character profile")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra random seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with a 5xx error")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--seed", type=int, help="seed for reproducible latency and failures")
+    parser.add_argument("--no-etags", dest="etags", action="store_false", help="never send ETags or answer 304")
+    options = parser.parse_args()
+
+    app = create_app(
+        runs_per_profile=options.runs_per_profile, latency=options.latency, jitter=options.jitter,
+        error_rate=options.error_rate, throttle_rate=options.throttle_rate,
+        retry_after=options.retry_after, seed=options.seed, etags=options.etags
+    )
+    print(f"Point the bot at RAIDERIO_API_URL=http://{options.host}:{options.port}/api/v1")
+    web.run_app(app, host=options.host, port=options.port, access_log=None)
+
+if __name__ == "__main__":
+    main()
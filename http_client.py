@@ -0,0 +1,63 @@
+import aiohttp
+import logging
+from contextlib import asynccontextmanager
+
+import config
+
+logger = logging.getLogger('http_client')
+
+# How long resolved Raider.io addresses are cached
+DNS_CACHE_TTL_SECONDS = 300
+
+# How long idle keep-alive connections are kept open
+KEEPALIVE_TIMEOUT_SECONDS = 60
+
+# Process-wide session shared by every Raider.io call
+_session = None
+
+def create_session():
+    """Create a session with a tuned connector for talking to Raider.io"""
+    connector = aiohttp.TCPConnector(
+        limit=config.RAIDERIO_CONNECTION_LIMIT,
+        limit_per_host=config.RAIDERIO_CONNECTION_LIMIT,
+        ttl_dns_cache=DNS_CACHE_TTL_SECONDS,
+        keepalive_timeout=KEEPALIVE_TIMEOUT_SECONDS
+    )
+    timeout = aiohttp.ClientTimeout(total=config.RAIDERIO_REQUEST_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+async def open_session():
+    """Open the shared session, called once at startup"""
+    global _session
+    if _session is None or _session.closed:
+        _session = create_session()
+        logger.info("Opened shared HTTP session")
+    return _session
+
+async def close_session():
+    """Close the shared session, called once at shutdown"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("Closed shared HTTP session")
+    _session = None
+
+def get_session():
+    """Get the shared session, or None if it is not open"""
+    if _session is None or _session.closed:
+        return None
+    return _session
+
+@asynccontextmanager
+async def session_scope():
+    """Use the shared session if it is open, otherwise a temporary one"""
+    shared = get_session()
+    if shared is not None:
+        yield shared
+        return
+
+    session = create_session()
+    try:
+        yield session
+    finally:
+        await session.close()
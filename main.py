@@ -5,12 +5,18 @@ import asyncio
 import logging
 import sys
 import os
+import time
 import traceback
 from datetime import datetime, timedelta
 
 import config
-from database import Database
-from raiderio_api import RaiderIO
+import http_client
+import scheduler
+from database import AsyncDatabase
+from raiderio_api import (
+    NOT_MODIFIED, RaiderIO, ensure_run_id, get_profile_fingerprint, get_profile_realm_slug,
+    is_new_run, profile_validators, rate_limiter, run_details_cache, run_watermark
+)
 import utils
 
 # Set up logging
@@ -27,10 +33,25 @@ logger = logging.getLogger('mythic_tracker')
 intents = discord.Intents.default()
 intents.message_content = True
 
-bot = commands.Bot(command_prefix=config.PREFIX, intents=intents)
+class MythicTrackerBot(commands.Bot):
+    """Bot that owns the process-wide Raider.io HTTP session"""
+
+    async def setup_hook(self):
+        """Open the shared HTTP session before the bot connects"""
+        await http_client.open_session()
+
+    async def close(self):
+        """Stop the check workers and close the shared HTTP session when the bot shuts down"""
+        try:
+            await stop_check_workers()
+            await super().close()
+        finally:
+            await http_client.close_session()
+
+bot = MythicTrackerBot(command_prefix=config.PREFIX, intents=intents)
 
-# Initialize database
-db = Database()
+# Initialize database, all calls run on a dedicated database thread
+db = AsyncDatabase()
 
 # Define a check to restrict commands to the specified channel
 def is_in_allowed_channel():
@@ -47,7 +68,7 @@ def is_in_allowed_channel():
             return False
 
         # Check if there's a server-specific channel configured
-        server_channel_id = db.get_server_channel(server_id)
+        server_channel_id = await db.get_server_channel(server_id)
 
         # Server must have a channel configured
         if not server_channel_id:
@@ -131,9 +152,8 @@ async def on_ready():
         logger.error(f"Failed to sync commands: {e}")
         logger.error(traceback.format_exc())
 
-    # Start the background task to check for new runs
-    if not check_mythic_runs.is_running():
-        check_mythic_runs.start()
+    # Start the background workers that check for new runs
+    start_check_workers()
 
 @bot.event
 async def on_app_command_error(interaction: discord.Interaction, error):
@@ -151,133 +171,555 @@ async def on_app_command_error(interaction: discord.Interaction, error):
         logger.error(f"Error sending error message: {e}")
         logger.error(traceback.format_exc())
 
-@tasks.loop(seconds=config.CHECK_INTERVAL)
-async def check_mythic_runs():
-    """Background task to check for new mythic+ runs"""
-    logger.info("Checking for new mythic+ runs...")
-
-    # Get all tracked players
-    players = db.get_all_players()
-    if not players:
-        logger.info("No players are being tracked")
-        return
-
-    logger.info(f"Found {len(players)} tracked players")
+# Characters waiting to be checked, ordered by due time
+check_queue = scheduler.CheckQueue()
+
+# Polling worker tasks, started once the bot is ready
+check_workers = []
+
+# Players with nothing new only need last_checked bumped, and new polling
+# schedules and profile fingerprints only need persisting, so they are all
+# batched and flushed together. pending_schedules maps player ID to
+# (interval, next_check_at), pending_fingerprints maps player ID to fingerprint.
+pending_checked_player_ids = []
+pending_schedules = {}
+pending_fingerprints = {}
+
+# Every tracked character by normalize_character key and by Raider.io
+# character ID, rebuilt with the check queue, so run rosters can be matched
+# against tracked characters. tracked_characters maps a normalize_character key
+# to the character's check key, tracked_character_ids maps a character ID (which
+# is also its check key) to its normalize_character key, or None if the realm
+# slug is unknown.
+tracked_characters = {}
+tracked_character_ids = {}
+
+def start_check_workers():
+    """Start the polling workers and the queue refresh loop"""
+    if not check_workers:
+        for index in range(config.MAX_CONCURRENT_CHECKS):
+            check_workers.append(asyncio.create_task(check_worker(), name=f"check-worker-{index}"))
+        logger.info(f"Started {len(check_workers)} check workers")
+
+    if not refresh_check_queue.is_running():
+        refresh_check_queue.start()
+
+async def stop_check_workers():
+    """Stop the polling workers and persist any batched player updates"""
+    if refresh_check_queue.is_running():
+        refresh_check_queue.cancel()
+
+    for worker in check_workers:
+        worker.cancel()
+    await asyncio.gather(*check_workers, return_exceptions=True)
+    check_workers.clear()
+
+    await flush_player_updates()
+
+async def check_worker():
+    """Pull due characters off the check queue and check them, one at a time"""
+    while True:
+        key = await check_queue.get()
+        next_due_at = time.time() + config.CHECK_INTERVAL
+        try:
+            character_players = await get_character_players(key)
+            if character_players is None:
+                # Could not read the rows, keep the character and try again later
+                continue
+            if not character_players:
+                # Untracked while it was waiting in the queue
+                next_due_at = None
+                continue
 
-    async with RaiderIO() as rio:
-        for player in players:
-            try:
-                logger.info(f"Checking runs for {player['name']}-{player['realm']} ({player['region']})")
-                logger.info(f"Last run ID: {player['last_run_id']}, Last checked: {player['last_checked']}")
-
-                # Get player's recent runs
-                data = await rio.get_character_mythic_plus_runs(
-                    player['name'],
-                    player['realm'],
-                    player['region']
+            async with RaiderIO() as rio:
+                found_new_run, last_run_at = await check_character_runs(
+                    rio, character_players, pending_checked_player_ids
                 )
 
-                if not data:
-                    logger.warning(f"No data found for {player['name']}-{player['realm']}")
-                    db.update_player_last_checked(player['id'])
-                    continue
+            interval, next_check_at = schedule_character(character_players, found_new_run, last_run_at)
+            for player in character_players:
+                pending_schedules[player['id']] = (interval, next_check_at)
+            next_due_at = scheduler.due_timestamp(next_check_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in check worker for {key}: {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            check_queue.done(key, next_due_at)
+
+async def flush_player_updates():
+    """Write batched last_checked timestamps, polling schedules and profile fingerprints"""
+    checked_player_ids = pending_checked_player_ids[:]
+    schedules = [
+        (player_id, interval, next_check_at)
+        for player_id, (interval, next_check_at) in pending_schedules.items()
+    ]
+    fingerprints = list(pending_fingerprints.items())
+    pending_checked_player_ids.clear()
+    pending_schedules.clear()
+    pending_fingerprints.clear()
 
-                logger.info(f"Data received for {player['name']}-{player['realm']}")
+    await db.update_players_last_checked(checked_player_ids)
+    await db.update_players_schedule(schedules)
+    await db.update_players_fingerprint(fingerprints)
 
-                # Debug the data
-                if isinstance(data, dict):
-                    logger.info(f"Data keys: {data.keys()}")
-                    if "mythic_plus_recent_runs" in data:
-                        logger.info(f"Found {len(data['mythic_plus_recent_runs'])} recent runs")
-                    else:
-                        logger.warning(f"No mythic_plus_recent_runs key in data")
-                else:
-                    logger.warning(f"Data is not a dictionary: {type(data)}")
+@tasks.loop(seconds=config.CHECK_INTERVAL)
+async def refresh_check_queue():
+    """Flush batched player updates and keep the check queue in step with tracked players"""
+    await flush_player_updates()
+
+    # The same character can be tracked by several servers, so group the
+    # player rows by character and queue each distinct character only once
+    players = await db.get_all_players()
+    if players is None:
+        # Keep the current queue rather than dropping every character on a failed read
+        logger.warning("Could not read tracked players, keeping the current check queue")
+        return
 
-                # Parse runs
-                runs = rio.parse_mythic_plus_runs(data)
-                if not runs:
-                    logger.info(f"No recent runs found for {player['name']}-{player['realm']}")
-                    db.update_player_last_checked(player['id'])
+    characters = group_players_by_character(players)
+    tracked_characters.clear()
+    tracked_character_ids.clear()
+    for key, rows in characters.items():
+        realm_slug = character_realm_slug(rows)
+        slug_key = normalize_character(rows[0]['name'], realm_slug, rows[0]['region']) if realm_slug else None
+        if slug_key:
+            tracked_characters[slug_key] = key
+        if isinstance(key, int):
+            tracked_character_ids[key] = slug_key
+    added = check_queue.sync({
+        key: min(scheduler.due_timestamp(player['next_check_at']) for player in rows)
+        for key, rows in characters.items()
+    })
+    if added:
+        logger.info(f"Queued {added} newly tracked characters")
+
+    queue_stats = check_queue.get_stats()
+    logger.info(f"Check queue: {queue_stats} ({len(players)} tracked players, "
+                f"{len(characters)} distinct characters, {len(check_workers)} workers)")
+    logger.info(f"Raider.io rate limiter: {rate_limiter.get_stats()}")
+    logger.info(f"Run details cache: {run_details_cache.get_stats()}")
+    logger.info(f"Profile validators: {profile_validators.get_stats()}")
+    logger.info(f"Database pool: {await db.get_pool_stats()}")
+    if queue_stats["max_lag_seconds"] > config.CHECK_INTERVAL:
+        logger.warning(f"Checks are running {queue_stats['max_lag_seconds']}s behind schedule, "
+                       f"consider raising MAX_CONCURRENT_CHECKS")
+
+def schedule_character(character_players, found_new_run, last_run_at):
+    """Work out the next check for a character, returns (interval, next_check_at)"""
+    # Schedules not flushed yet are newer than the stored check_interval
+    previous_interval = max(
+        pending_schedules.get(player['id'], (player['check_interval'],))[0] or 0
+        for player in character_players
+    )
+    interval = scheduler.next_check_interval(previous_interval, found_new_run, last_run_at)
+    next_check_at = scheduler.next_check_time(interval)
+    logger.info(f"Next check for {character_players[0]['name']}-{character_players[0]['realm']} in {interval}s")
+    return interval, next_check_at
+
+def character_check_key(player):
+    """Get the key a player row's character is grouped and queued under
+
+    Rows are keyed by Raider.io character ID once it is known, otherwise by
+    (name, realm slug, region), with the realm as typed until the slug is learned.
+    """
+    if player['character_id']:
+        return player['character_id']
+    return player['name'], player['realm_slug'] or player['realm'], player['region']
+
+async def get_character_players(key):
+    """Get every tracked player row behind a check key, None if the read failed"""
+    if isinstance(key, int):
+        return await db.get_players_by_character_id(key)
+    return await db.get_players_by_character(*key)
+
+def group_players_by_character(players):
+    """Group tracked player rows by character_check_key"""
+    characters = {}
+    for player in players:
+        characters.setdefault(character_check_key(player), []).append(player)
+    return characters
+
+def stored_fingerprint(player):
+    """Get the profile fingerprint a player row was last checked against"""
+    # Fingerprints not flushed yet are newer than the stored column
+    return pending_fingerprints.get(player['id'], player['profile_fingerprint'])
+
+def remember_fingerprint(character_players, fingerprint):
+    """Queue the fingerprint of a fully processed profile for every row of the character"""
+    if fingerprint:
+        for player in character_players:
+            pending_fingerprints[player['id']] = fingerprint
+
+def normalize_character(name, realm_slug, region):
+    """Get a character key comparable between stored players and Raider.io rosters
+
+    Realms are compared by Raider.io's own slug, taken from a profile URL or a
+    roster entry, since realms as users type them cannot be slugged reliably.
+    """
+    return name.strip().lower(), realm_slug.strip().lower(), region.strip().lower()
+
+def character_realm_slug(character_players):
+    """Get the realm slug learned for a character's player rows, or None"""
+    return next((player['realm_slug'] for player in character_players if player['realm_slug']), None)
+
+def roster_character_data(character):
+    """Build the character data create_run_embed expects from a run roster entry"""
+    return {
+        "name": character.get("name", "Unknown"),
+        "realm": (character.get("realm") or {}).get("name", "Unknown"),
+        "region": (character.get("region") or {}).get("slug", "us"),
+        "class": (character.get("class") or {}).get("name", ""),
+        "active_spec_name": (character.get("spec") or {}).get("name", "Unknown"),
+        "active_spec_role": (character.get("spec") or {}).get("role", "")
+    }
+
+def roster_character_key(character):
+    """Get the normalize_character key of a run roster entry"""
+    return normalize_character(
+        character["name"],
+        (character.get("realm") or {}).get("slug", ""),
+        (character.get("region") or {}).get("slug", "")
+    )
+
+def find_roster_character(runs, name, realm_slug, region):
+    """Find a character in the rosters of the given runs by name, realm slug and region"""
+    key = normalize_character(name, realm_slug, region)
+    for run in runs:
+        for member in run.get("roster") or []:
+            character = member.get("character") if isinstance(member, dict) else None
+            if isinstance(character, dict) and character.get("name") and roster_character_key(character) == key:
+                return character
+    return None
+
+async def store_realm_slug(data, character_players):
+    """Store a character's realm slug, taken from its profile URL, returns the slug or None
+
+    The rows are regrouped under their new key when the check queue is next refreshed.
+    """
+    realm_slug = get_profile_realm_slug(data)
+    if realm_slug:
+        await db.set_realm_slug([player['id'] for player in character_players], realm_slug)
+    return realm_slug
+
+async def store_character_id(runs, character_players, realm_slug):
+    """Store a character's Raider.io ID, taken from its entry in a run roster"""
+    name, region = character_players[0]['name'], character_players[0]['region']
+    character = find_roster_character(runs, name, realm_slug, region) if realm_slug else None
+    if not character or not character.get("id"):
+        return None
+
+    await db.set_character_id([player['id'] for player in character_players], character["id"])
+    slug_key = normalize_character(name, realm_slug, region)
+    tracked_characters[slug_key] = character["id"]
+    tracked_character_ids[character["id"]] = slug_key
+    return character["id"]
+
+async def follow_rename(character_id, old_key, new_key):
+    """Move a renamed or transferred character's rows to its new name"""
+    moved, merged = await db.rename_character(character_id, *new_key)
+    logger.info(f"Character {character_id} is now {'-'.join(new_key)} (was {'-'.join(old_key)}), "
+                f"updated {moved} tracked row(s)")
+    if merged:
+        logger.info(f"Merged {merged} row(s) of {'-'.join(old_key)} into rows already tracking {'-'.join(new_key)}")
+
+    tracked_characters.pop(old_key, None)
+    tracked_characters[new_key] = character_id
+    tracked_character_ids[character_id] = new_key
+
+async def match_roster_players(runs, character_players):
+    """Find other tracked characters in the rosters of new runs
+
+    Roster entries are matched on their Raider.io character ID, falling back
+    to name, realm and region for rows stored before the ID was known. A
+    character found by ID under a different name has been renamed or
+    transferred, and its rows follow it.
+
+    Returns record_player_runs entries that store and announce each run for
+    them. A player's watermark only moves to a shared run that started before
+    their last check, since any other run of theirs has then been seen already.
+    Otherwise it is left alone and their own next check skips the recorded runs.
+    """
+    # The checked character may have learned its ID during this check, so skip its rows by ID
+    checked_key = character_check_key(character_players[0])
+    checked_player_ids = {player['id'] for player in character_players}
+    matches = []
+    newest_shared_runs = {}
+    for run in runs:
+        for member in run.get("roster") or []:
+            character = member.get("character") if isinstance(member, dict) else None
+            if not isinstance(character, dict) or not character.get("name"):
+                continue
+
+            roster_key = roster_character_key(character)
+            character_id = character.get("id")
+            if character_id in tracked_character_ids:
+                key = character_id
+                slug_key = tracked_character_ids[character_id]
+                if slug_key and slug_key != roster_key:
+                    await follow_rename(character_id, slug_key, roster_key)
+            else:
+                key = tracked_characters.get(roster_key)
+            if key is None or key == checked_key:
+                continue
+
+            character_data = roster_character_data(character)
+            players = await get_character_players(key) or []
+            for player in players:
+                if player['id'] in checked_player_ids:
                     continue
+                if is_new_run(run, player['last_run_id'], player['last_run_completed_at']):
+                    matches.append((player, [run], None, character_data, None))
+                    newest = newest_shared_runs.get(player['id'])
+                    if shared_run_follows_last_check(player, run) and (
+                        newest is None or run_watermark(run) > run_watermark(newest)
+                    ):
+                        newest_shared_runs[player['id']] = run
+
+    # Each player's watermark moves once, to the newest shared run it safely can
+    for index, (player, runs, newest_run, character_data, checked_at) in enumerate(matches):
+        if newest_shared_runs.get(player['id']) is runs[0]:
+            completed_at = scheduler.parse_timestamp(runs[0].get("completed_at"))
+            # last_checked holds local time, and the profile is known up to the run's end
+            matches[index] = (player, runs, runs[0], character_data, completed_at.astimezone().replace(tzinfo=None))
+    return matches
+
+def shared_run_follows_last_check(player, run):
+    """Check whether a shared run started before a player's last check
+
+    A character is in one key at a time, so if their profile was last seen
+    after the run started, no other run of theirs can have ended between
+    that check and this run.
+    """
+    last_checked = scheduler.parse_local_timestamp(player['last_checked'])
+    completed_at = scheduler.parse_timestamp(run.get("completed_at"))
+    clear_time_ms = run.get("clear_time_ms")
+    if last_checked is None or completed_at is None or not clear_time_ms:
+        return False
+    return last_checked >= completed_at - timedelta(milliseconds=clear_time_ms)
+
+def defer_roster_checks(roster_matches):
+    """Push back the next check of roster characters whose watermark moved with a shared run
+
+    Characters with any row left behind the run keep their schedule.
+    """
+    characters = {}
+    for player, runs, newest_run, character_data, checked_at in roster_matches:
+        characters.setdefault(character_check_key(player), []).append((player, newest_run))
+
+    for key, entries in characters.items():
+        if any(newest_run is None for player, newest_run in entries):
+            continue
+
+        character_players = [player for player, newest_run in entries]
+        last_run_at = max(newest_run.get("completed_at") or '' for player, newest_run in entries)
+        interval, next_check_at = schedule_character(character_players, True, last_run_at)
+        if check_queue.defer(key, scheduler.due_timestamp(next_check_at)):
+            for player in character_players:
+                pending_schedules[player['id']] = (interval, next_check_at)
+
+async def check_character_runs(rio, character_players, checked_player_ids):
+    """Check a single character for new mythic+ runs on behalf of every server tracking it
+
+    Returns (found_new_run, last_run_at) for the polling schedule.
+    """
+    name = character_players[0]['name']
+    # Rows of one character may have typed the realm differently, the slug is canonical
+    realm = character_realm_slug(character_players) or character_players[0]['realm']
+    region = character_players[0]['region']
 
-                logger.info(f"Parsed {len(runs)} runs for {player['name']}-{player['realm']}")
+    try:
+        logger.info(f"Checking runs for {name}-{realm} ({region}), tracked in {len(character_players)} server(s)")
 
-                # Get the latest run
-                latest_run = rio.get_latest_run(runs)
-                if not latest_run:
-                    logger.warning(f"Could not determine latest run for {player['name']}-{player['realm']}")
-                    continue
+        # Get the character's recent runs, unless they are unchanged since the last full fetch
+        data = await rio.get_character_mythic_plus_runs(name, realm, region, conditional=True)
+        if data is NOT_MODIFIED and any(not stored_fingerprint(player) for player in character_players):
+            # A row tracked since the last full fetch has not been checked against it
+            rio.forget_profile(name, realm, region)
+            data = await rio.get_character_mythic_plus_runs(name, realm, region)
 
-                logger.info(f"Latest run for {player['name']}-{player['realm']}: {latest_run.get('mythic_plus_id', 0)}")
-
-                # Get detailed run information
-                try:
-                    logger.info(f"Fetching detailed run information")
-                    detailed_run = await rio.get_run_details(latest_run)
-                    if detailed_run != latest_run:
-                        logger.info(f"Got detailed run information")
-                        latest_run = detailed_run
-                except Exception as e:
-                    logger.error(f"Error fetching detailed run information: {e}")
-                    logger.error(traceback.format_exc())
-
-                # Check if this is a new run and from Season 3
-                run_id = latest_run.get("mythic_plus_id", 0)
-                run_url = latest_run.get("url", "")
-
-                # Only track Season 3 runs
-                if 'season-tww-3' not in run_url:
-                    logger.info(f"Skipping non-Season 3 run for {player['name']}-{player['realm']}: {run_id}")
-                    db.update_player_last_checked(player['id'])
-                    continue
+        if not data:
+            logger.warning(f"No data found for {name}-{realm}")
+            checked_player_ids.extend(player['id'] for player in character_players)
+            return False, None
+
+        # Learn the realm slug run rosters use the first time the full profile is seen
+        if data is not NOT_MODIFIED and any(not player['realm_slug'] for player in character_players):
+            await store_realm_slug(data, character_players)
+
+        # Stop here if the recent runs look exactly as they did at the last check
+        fingerprint = None if data is NOT_MODIFIED else get_profile_fingerprint(data)
+        if data is NOT_MODIFIED or (
+            fingerprint and all(stored_fingerprint(player) == fingerprint for player in character_players)
+        ):
+            logger.info(f"Recent runs unchanged for {name}-{realm}")
+            checked_player_ids.extend(player['id'] for player in character_players)
+            last_run_at = max(player['last_run_completed_at'] or '' for player in character_players)
+            return False, last_run_at or None
+
+        logger.info(f"Data received for {name}-{realm}")
+
+        # Debug the data
+        if isinstance(data, dict):
+            logger.info(f"Data keys: {data.keys()}")
+            if "mythic_plus_recent_runs" in data:
+                logger.info(f"Found {len(data['mythic_plus_recent_runs'])} recent runs")
+            else:
+                logger.warning(f"No mythic_plus_recent_runs key in data")
+        else:
+            logger.warning(f"Data is not a dictionary: {type(data)}")
+
+        # Parse runs
+        runs = rio.parse_mythic_plus_runs(data)
+        if not runs:
+            logger.info(f"No recent runs found for {name}-{realm}")
+            checked_player_ids.extend(player['id'] for player in character_players)
+            remember_fingerprint(character_players, fingerprint)
+            return False, None
+
+        logger.info(f"Parsed {len(runs)} runs for {name}-{realm}")
+
+        # Get the latest run
+        latest_run = rio.get_latest_run(runs)
+        if not latest_run:
+            logger.warning(f"Could not determine latest run for {name}-{realm}")
+            return False, None
+
+        last_run_at = latest_run.get("completed_at")
+
+        # Work out from the profile alone which runs each server has not seen yet,
+        # so run details are only fetched for genuinely new runs
+        new_runs_by_player = {}
+        for player in character_players:
+            player_runs = rio.get_new_runs(runs, player['last_run_id'], player['last_run_completed_at'])
+            if player_runs:
+                new_runs_by_player[player['id']] = player_runs
+            else:
+                logger.info(f"No new runs for {name}-{realm} in server {player['server_id']} (stored: {player['last_run_id']})")
+                checked_player_ids.append(player['id'])
+
+        if not new_runs_by_player:
+            remember_fingerprint(character_players, fingerprint)
+            return False, last_run_at
+
+        # Runs already linked to a player were recorded from another tracked
+        # character's roster, they only move the watermark
+        linked = await db.get_linked_runs(
+            list(new_runs_by_player),
+            list({ensure_run_id(run) for player_runs in new_runs_by_player.values() for run in player_runs})
+        )
 
-                if run_id > player['last_run_id']:
-                    logger.info(f"New run found for {player['name']}-{player['realm']}: {run_id} (previous: {player['last_run_id']})")
-
-                    # Add run to database
-                    dungeon_info = latest_run.get("dungeon", {})
-                    if isinstance(dungeon_info, dict):
-                        dungeon_name = dungeon_info.get("name", "Unknown")
-                    elif isinstance(dungeon_info, str):
-                        dungeon_name = dungeon_info
-                    else:
-                        dungeon_name = "Unknown"
-
-                    mythic_level = latest_run.get("mythic_level", 0)
-                    completed_at = latest_run.get("completed_at", "")
-                    timed = latest_run.get("is_completed_within_time", False)
-                    run_time_ms = latest_run.get("clear_time_ms", 0)
-                    score = latest_run.get("score", 0)
-                    url = latest_run.get("url", "")
-
-                    logger.info(f"Run details: {dungeon_name} +{mythic_level}, Completed: {completed_at}, Timed: {timed}")
-
-                    db.add_run(
-                        player['id'], run_id, dungeon_name, mythic_level,
-                        completed_at, timed, run_time_ms, score, url, latest_run
-                    )
-                    logger.info(f"Added run to database")
-
-                    # Update player's last run ID
-                    db.update_player_last_run(player['id'], run_id)
-                    logger.info(f"Updated player's last run ID to {run_id}")
-
-                    # Send notification to the server where the player is tracked
-                    logger.info(f"Sending notification for new run")
-                    await send_run_notification(latest_run, data, player['id'])
-                    logger.info(f"Notification sent")
-                else:
-                    logger.info(f"No new runs for {player['name']}-{player['realm']} (latest: {run_id}, stored: {player['last_run_id']})")
-                    # Just update the last checked timestamp
-                    db.update_player_last_checked(player['id'])
+        # One details fetch per distinct unrecorded run, all in flight together
+        new_runs = {}
+        for player_id, player_runs in new_runs_by_player.items():
+            for run in player_runs:
+                if (player_id, ensure_run_id(run)) not in linked:
+                    new_runs.setdefault(ensure_run_id(run), run)
+        logger.info(f"Found {len(new_runs)} new run(s) for {name}-{realm}, fetching details")
+
+        details = await asyncio.gather(
+            *(rio.get_run_details(run) for run in new_runs.values()),
+            return_exceptions=True
+        )
+        for run_id, detailed_run in zip(list(new_runs), details):
+            if isinstance(detailed_run, Exception):
+                logger.error(f"Error fetching detailed run information for run {run_id}: {detailed_run}")
+            elif detailed_run:
+                new_runs[run_id] = detailed_run
+
+        # Learn the character's Raider.io ID from its own run's roster
+        if any(not player['character_id'] for player in character_players):
+            realm_slug = get_profile_realm_slug(data) or character_realm_slug(character_players)
+            await store_character_id(new_runs.values(), character_players, realm_slug)
+
+        catch_up = [
+            (player, [new_runs[ensure_run_id(run)] for run in new_runs_by_player[player['id']]
+                      if (player['id'], ensure_run_id(run)) not in linked],
+             new_runs_by_player[player['id']][-1], data, None)
+            for player in character_players if player['id'] in new_runs_by_player
+        ]
+
+        # Record the runs for every other tracked character in their rosters now,
+        # so their own checks find them already stored
+        roster_matches = await match_roster_players(list(new_runs.values()), character_players)
+        if roster_matches:
+            logger.info(f"Recording {len(roster_matches)} run(s) for tracked characters in {name}-{realm}'s groups")
+        if await record_player_runs(catch_up + roster_matches):
+            remember_fingerprint(character_players, fingerprint)
+            # Their redundant profile fetches come off the schedule
+            defer_roster_checks(roster_matches)
+        else:
+            # Make sure the next check sees the whole profile again
+            rio.forget_profile(name, realm, region)
+        return True, last_run_at
+
+    except Exception as e:
+        logger.error(f"Error checking runs for {name}-{realm}: {e}")
+        logger.error(traceback.format_exc())
+        rio.forget_profile(name, realm, region)
+        return False, None
+
+def run_columns(run):
+    """Get the keystone_runs column values for a run, as add_run takes them"""
+    dungeon_info = run.get("dungeon", {})
+    if isinstance(dungeon_info, dict):
+        dungeon_name = dungeon_info.get("name", "Unknown")
+    elif isinstance(dungeon_info, str):
+        dungeon_name = dungeon_info
+    else:
+        dungeon_name = "Unknown"
+
+    return (
+        ensure_run_id(run), dungeon_name, run.get("mythic_level", 0),
+        run.get("completed_at", ""), run.get("is_completed_within_time", False),
+        run.get("clear_time_ms", 0), run.get("score", 0), run.get("url", "")
+    )
+
+async def record_player_runs(catch_up):
+    """Store new runs for several tracked player rows in one transaction, then announce them
+
+    catch_up is a list of (player, runs, newest_run, character_data, checked_at)
+    with runs oldest first. newest_run, if given, becomes the player's watermark
+    in the same commit, with last_checked set to checked_at (default now).
+    Runs already linked to a player are not announced again.
+    Returns False if the runs could not be stored.
+    """
+    def store_runs(database):
+        stored = []
+        for player, runs, newest_run, character_data, checked_at in catch_up:
+            for run in runs:
+                if database.add_run(player['id'], *run_columns(run), run):
+                    stored.append((player, run, character_data))
+            if newest_run is not None:
+                database.update_player_last_run(
+                    player['id'], ensure_run_id(newest_run), newest_run.get("completed_at"), checked_at
+                )
+        return stored
+
+    try:
+        stored = await db.run_transaction(store_runs)
+    except Exception as e:
+        logger.error(f"Error storing new runs: {e}")
+        logger.error(traceback.format_exc())
+        return False
+
+    for player, runs, newest_run, character_data, checked_at in catch_up:
+        if newest_run is not None:
+            logger.info(f"Caught up {player['name']}-{player['realm']} in server {player['server_id']} "
+                        f"(previous: {player['last_run_id']}, now: {ensure_run_id(newest_run)})")
 
-            except Exception as e:
-                logger.error(f"Error checking runs for {player['name']}-{player['realm']}: {e}")
-                logger.error(traceback.format_exc())
+    for player, run, character_data in stored:
+        logger.info(f"Announcing run {ensure_run_id(run)} for {player['name']}-{player['realm']} in server {player['server_id']}")
+        try:
+            await send_run_notification(run, character_data, player['id'])
+        except Exception as e:
+            logger.error(f"Error sending notification for run {ensure_run_id(run)} to server {player['server_id']}: {e}")
+            logger.error(traceback.format_exc())
 
-@check_mythic_runs.before_loop
-async def before_check_mythic_runs():
+    return True
+
+@refresh_check_queue.before_loop
+async def before_refresh_check_queue():
     """Wait until the bot is ready before starting the task"""
     await bot.wait_until_ready()
 
@@ -300,17 +742,18 @@ async def send_run_notification(run_data, character_data, player_id=None):
     else:
         logger.warning(f"Run data is not a dictionary: {type(run_data)}")
 
-    # Get detailed run information
-    try:
-        async with RaiderIO() as rio:
-            logger.info(f"Fetching detailed run information for notification")
-            detailed_run = await rio.get_run_details(run_data)
-            if detailed_run != run_data:
-                logger.info(f"Got detailed run information for notification")
-                run_data = detailed_run
-    except Exception as e:
-        logger.error(f"Error fetching detailed run information for notification: {e}")
-        logger.error(traceback.format_exc())
+    # Get detailed run information, unless the caller already merged it in
+    if isinstance(run_data, dict) and "roster" not in run_data:
+        try:
+            async with RaiderIO() as rio:
+                logger.info(f"Fetching detailed run information for notification")
+                detailed_run = await rio.get_run_details(run_data)
+                if detailed_run != run_data:
+                    logger.info(f"Got detailed run information for notification")
+                    run_data = detailed_run
+        except Exception as e:
+            logger.error(f"Error fetching detailed run information for notification: {e}")
+            logger.error(traceback.format_exc())
 
     # Create the embed
     embed = utils.create_run_embed(run_data, character_data)
@@ -329,16 +772,14 @@ async def send_run_notification(run_data, character_data, player_id=None):
     if player_id:
         try:
             # Get the player record to find the server_id
-            cursor = db.connection.cursor()
-            cursor.execute('SELECT server_id FROM players WHERE id = ?', (player_id,))
-            result = cursor.fetchone()
+            result = await db.get_player_by_id(player_id)
 
             if result:
                 server_id = result['server_id']
                 logger.info(f"Found server_id {server_id} for player_id {player_id}")
 
                 # Get the channel ID for this server
-                channel_id = db.get_server_channel(server_id)
+                channel_id = await db.get_server_channel(server_id)
 
                 if channel_id:
                     logger.info(f"Using server-specific channel ID: {channel_id} for server {server_id}")
@@ -372,14 +813,11 @@ async def send_run_notification(run_data, character_data, player_id=None):
 
     # If we get here, we couldn't find a specific channel, so use the old behavior
     logger.info("No specific channel configured, sending to all guilds")
+    result = await db.get_player_by_id(player_id) if player_id else None
     for guild in bot.guilds:
         try:
             # If we have a player_id, check if this guild is the one where the player is tracked
             if player_id:
-                cursor = db.connection.cursor()
-                cursor.execute('SELECT server_id FROM players WHERE id = ?', (player_id,))
-                result = cursor.fetchone()
-
                 if result and result['server_id'] != str(guild.id):
                     logger.info(f"Skipping guild {guild.name} ({guild.id}) as it's not the server where the player is tracked")
                     continue
@@ -439,7 +877,7 @@ async def track_and_check_command(interaction: discord.Interaction, name: str, r
         try:
             async with RaiderIO() as rio:
                 logger.info(f"Fetching character profile for {name}-{realm} ({region})")
-                data = await rio.get_character_profile(name, realm, region)
+                data = await rio.get_character_notification_context(name, realm, region)
 
                 if not data:
                     logger.warning(f"Character not found: {name}-{realm} ({region})")
@@ -448,7 +886,7 @@ async def track_and_check_command(interaction: discord.Interaction, name: str, r
 
                 # Add player to database with server ID
                 logger.info(f"Adding player to database: {name}-{realm} ({region}) for server {server_id}")
-                success = db.add_player(name, realm, region, server_id)
+                success = await db.add_player(name, realm, region, server_id)
 
                 if success:
                     logger.info(f"Successfully added player: {name}-{realm} ({region}) for server {server_id}")
@@ -458,7 +896,7 @@ async def track_and_check_command(interaction: discord.Interaction, name: str, r
                     await interaction.followup.send(f"Already tracking {name}-{realm} ({region}).")
 
                 # Get player from database to get the ID
-                player = db.get_player_by_name_realm(name, realm, region, server_id)
+                player = await db.get_player_by_name_realm(name, realm, region, server_id)
                 if not player:
                     logger.error(f"Could not find player in database after adding: {name}-{realm} ({region}) for server {server_id}")
                     await interaction.followup.send(f"Error: Could not find player in database after adding.")
@@ -472,23 +910,32 @@ async def track_and_check_command(interaction: discord.Interaction, name: str, r
                     await interaction.followup.send(f"No recent runs found for {name}-{realm}.")
                     return
 
-                # Get the latest run
-                latest_run = rio.get_latest_run(runs)
-                if not latest_run:
+                # Work out which runs this server has not seen yet, a newly
+                # tracked character only gets its latest run
+                new_runs = rio.get_new_runs(runs, player['last_run_id'], player['last_run_completed_at'])
+                shown_runs = new_runs or [rio.get_latest_run(runs)]
+                if not shown_runs[-1]:
                     logger.warning(f"Could not determine latest run for {name}-{realm}")
                     await interaction.followup.send(f"Could not determine the latest run for {name}-{realm}.")
                     return
 
-                # Get detailed run information
-                try:
-                    logger.info(f"Fetching detailed run information")
-                    detailed_run = await rio.get_run_details(latest_run)
-                    if detailed_run != latest_run:
-                        logger.info(f"Got detailed run information")
-                        latest_run = detailed_run
-                except Exception as e:
-                    logger.error(f"Error fetching detailed run information: {e}")
-                    logger.error(traceback.format_exc())
+                # Get detailed run information, all fetches in flight together
+                logger.info(f"Fetching detailed run information for {len(shown_runs)} run(s)")
+                details = await asyncio.gather(
+                    *(rio.get_run_details(run) for run in shown_runs),
+                    return_exceptions=True
+                )
+                detailed_runs = []
+                for run, detailed_run in zip(shown_runs, details):
+                    if isinstance(detailed_run, Exception):
+                        logger.error(f"Error fetching detailed run information for run {ensure_run_id(run)}: {detailed_run}")
+                        detailed_run = None
+                    detailed_runs.append(detailed_run or run)
+                latest_run = detailed_runs[-1]
+
+                # The profile has no character ID, the run's roster does
+                realm_slug = await store_realm_slug(data, [player])
+                await store_character_id(detailed_runs, [player], realm_slug)
 
                 # Create embed with run information
                 embed = utils.create_run_embed(latest_run, data)
@@ -497,27 +944,19 @@ async def track_and_check_command(interaction: discord.Interaction, name: str, r
                     await interaction.followup.send(f"Error creating embed for the run.")
                     return
 
-                # Get run ID
-                run_id = latest_run.get("mythic_plus_id", 0)
-
-                # If the run doesn't have a mythic_plus_id, add it
-                if run_id == 0 and "keystone_run_id" in latest_run:
-                    run_id = latest_run["keystone_run_id"]
-                    latest_run["mythic_plus_id"] = run_id
-                    logger.info(f"Using keystone_run_id as mythic_plus_id: {run_id}")
-
-                # Update player's last run ID
-                db.update_player_last_run(player['id'], run_id)
-                logger.info(f"Updated player's last run ID to {run_id}")
-
                 # Add information about the run
-                embed.add_field(name="Status", value="✅ This is the latest run. You will be notified of any new runs.", inline=False)
+                if new_runs:
+                    embed.add_field(name="Status", value="✅ This is the latest run. You will be notified of any new runs.", inline=False)
+                else:
+                    embed.add_field(name="Status", value="ℹ️ This run is already tracked in the database.", inline=False)
 
                 # Send the embed to the user
                 await interaction.followup.send(embed=embed, ephemeral=True)
 
-                # Send notification to the server where the player is tracked
-                await send_run_notification(latest_run, data, player['id'])
+                # Store the new runs and move the watermark in one commit, then
+                # announce the runs that were not already recorded for this server
+                if new_runs:
+                    await record_player_runs([(player, detailed_runs, new_runs[-1], data, None)])
 
         except Exception as e:
             logger.error(f"Error in Raider.io API call: {e}")
@@ -562,8 +1001,9 @@ async def track_command(interaction: discord.Interaction, name: str, realm: str,
         # Check if player exists on Raider.io
         try:
             async with RaiderIO() as rio:
+                # The latest run seeds the watermark and character ID, the score is not needed
                 logger.info(f"Fetching character profile for {name}-{realm} ({region})")
-                data = await rio.get_character_profile(name, realm, region)
+                data = await rio.get_character_mythic_plus_runs(name, realm, region)
 
                 if not data:
                     logger.warning(f"Character not found: {name}-{realm} ({region})")
@@ -572,15 +1012,17 @@ async def track_command(interaction: discord.Interaction, name: str, realm: str,
 
                 # Add player to database with server ID
                 logger.info(f"Adding player to database: {name}-{realm} ({region}) for server {server_id}")
-                success = db.add_player(name, realm, region, server_id)
+                success = await db.add_player(name, realm, region, server_id)
 
                 if success:
                     logger.info(f"Successfully added player: {name}-{realm} ({region}) for server {server_id}")
 
                     # Get player from database to get the ID
-                    player = db.get_player_by_name_realm(name, realm, region, server_id)
+                    player = await db.get_player_by_name_realm(name, realm, region, server_id)
 
                     if player:
+                        realm_slug = await store_realm_slug(data, [player])
+
                         # Get recent runs to set the last run ID
                         logger.info(f"Parsing runs for {name}-{realm}")
                         runs = rio.parse_mythic_plus_runs(data)
@@ -589,7 +1031,11 @@ async def track_command(interaction: discord.Interaction, name: str, realm: str,
                             if latest_run:
                                 run_id = latest_run.get("mythic_plus_id", 0)
                                 logger.info(f"Setting last run ID to {run_id} for {name}-{realm}")
-                                db.update_player_last_run(player['id'], run_id)
+                                await db.update_player_last_run(player['id'], run_id, latest_run.get("completed_at"))
+
+                                # The profile has no character ID, the run's roster does
+                                detailed_run = await rio.get_run_details(latest_run)
+                                await store_character_id([detailed_run], [player], realm_slug)
 
                     await interaction.followup.send(f"Now tracking {name}-{realm} ({region}) for new mythic+ runs!")
                 else:
@@ -631,7 +1077,7 @@ async def untrack_command(interaction: discord.Interaction, name: str, realm: st
 
         # Remove player from database with server ID
         logger.info(f"Removing player from database: {name}-{realm} ({region}) for server {server_id}")
-        success = db.remove_player(name, realm, region, server_id)
+        success = await db.remove_player(name, realm, region, server_id)
 
         if success:
             logger.info(f"Successfully removed player: {name}-{realm} ({region}) from server {server_id}")
@@ -666,7 +1112,7 @@ async def list_command(interaction: discord.Interaction):
 
         # Get tracked players for this server
         logger.info(f"Fetching tracked players for server {server_id} from database")
-        players = db.get_players_by_server(server_id)
+        players = await db.get_players_by_server(server_id)
 
         if not players:
             logger.info(f"No players are being tracked in server {server_id}")
@@ -740,7 +1186,7 @@ async def set_channel_command(interaction: discord.Interaction, channel: discord
         await interaction.response.defer(ephemeral=True)
 
         # Set the channel in the database
-        success = db.set_server_channel(server_id, str(channel.id))
+        success = await db.set_server_channel(server_id, str(channel.id))
 
         if success:
             logger.info(f"Successfully set channel for server {server_id} to {channel.name} ({channel.id})")
@@ -829,17 +1275,27 @@ async def check_all_command(interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
 
         # Get all tracked players
-        players = db.get_all_players()
+        players = await db.get_all_players()
+        if players is None:
+            await interaction.followup.send("Could not read the tracked players, please try again later.")
+            return
         if not players:
             await interaction.followup.send("No players are being tracked.")
             return
 
-        await interaction.followup.send(f"Checking for new runs for {len(players)} tracked players...", ephemeral=True)
-
-        # Run the background task manually
-        await check_mythic_runs()
+        # Move every character to the front of the check queue instead of running
+        # a parallel sweep, characters already in flight are skipped
+        characters = group_players_by_character(players)
+        queued = sum(
+            check_queue.schedule(key, priority=scheduler.HIGH_PRIORITY)
+            for key in characters
+        )
 
-        await interaction.followup.send(f"Finished checking for new runs for all tracked players.", ephemeral=True)
+        await interaction.followup.send(
+            f"Queued {queued} of {len(characters)} tracked characters for an immediate check "
+            f"({len(characters) - queued} already queued or being checked).",
+            ephemeral=True
+        )
 
     except Exception as e:
         logger.error(f"Error in check_all command: {e}")
@@ -872,94 +1328,25 @@ async def check_runs_command(interaction: discord.Interaction, name: str, realm:
         await interaction.response.defer(ephemeral=True)
 
         # Check if the player is being tracked in this server
-        player = db.get_player_by_name_realm(name, realm, region, server_id)
+        player = await db.get_player_by_name_realm(name, realm, region, server_id)
         if not player:
             await interaction.followup.send(f"Not tracking {name}-{realm} ({region}) in this server. Use /track to start tracking this character.")
             return
 
-        # Get player's recent runs
-        async with RaiderIO() as rio:
-            logger.info(f"Fetching runs for {name}-{realm} ({region})")
-            data = await rio.get_character_mythic_plus_runs(name, realm, region)
-
-            if not data:
-                logger.warning(f"No data found for {name}-{realm} ({region})")
-                await interaction.followup.send(f"No data found for {name}-{realm} ({region}). The character might not exist or has no recent runs.")
-                return
-
-            # Parse runs
-            runs = rio.parse_mythic_plus_runs(data)
-            if not runs:
-                logger.info(f"No recent runs found for {name}-{realm} ({region})")
-                await interaction.followup.send(f"No recent runs found for {name}-{realm} ({region}).")
-                return
-
-            # Get the latest run
-            latest_run = rio.get_latest_run(runs)
-            if not latest_run:
-                await interaction.followup.send(f"Could not determine the latest run for {name}-{realm} ({region}).")
-                return
-
-            # Get detailed run information
-            try:
-                logger.info(f"Fetching detailed run information")
-                detailed_run = await rio.get_run_details(latest_run)
-                if detailed_run != latest_run:
-                    logger.info(f"Got detailed run information")
-                    latest_run = detailed_run
-            except Exception as e:
-                logger.error(f"Error fetching detailed run information: {e}")
-                logger.error(traceback.format_exc())
-
-            # Check if this is a new run
-            run_id = latest_run.get("mythic_plus_id", 0)
-
-            # Create embed with run information
-            embed = utils.create_run_embed(latest_run, data)
-            if not embed:
-                await interaction.followup.send(f"Error creating embed for the run.")
-                return
-
-            # Add information about whether this is a new run
-            if run_id > player['last_run_id']:
-                logger.info(f"New run found for {name}-{realm} ({region}): {run_id}")
-                embed.add_field(name="Status", value="✅ This is a new run! Updating database...", inline=False)
-
-                # Add run to database
-                dungeon_info = latest_run.get("dungeon", {})
-                if isinstance(dungeon_info, dict):
-                    dungeon_name = dungeon_info.get("name", "Unknown")
-                elif isinstance(dungeon_info, str):
-                    dungeon_name = dungeon_info
-                else:
-                    dungeon_name = "Unknown"
-
-                mythic_level = latest_run.get("mythic_level", 0)
-                completed_at = latest_run.get("completed_at", "")
-                timed = latest_run.get("is_completed_within_time", False)
-                run_time_ms = latest_run.get("clear_time_ms", 0)
-                score = latest_run.get("score", 0)
-                url = latest_run.get("url", "")
-
-                db.add_run(
-                    player['id'], run_id, dungeon_name, mythic_level,
-                    completed_at, timed, run_time_ms, score, url, latest_run
-                )
-
-                # Update player's last run ID
-                db.update_player_last_run(player['id'], run_id)
-
-                # Send notification to the server where the player is tracked
-                await send_run_notification(latest_run, data, player['id'])
-            else:
-                logger.info(f"Run already tracked for {name}-{realm} ({region}): {run_id}")
-                embed.add_field(name="Status", value="ℹ️ This run is already tracked in the database.", inline=False)
-
-                # Just update the last checked timestamp
-                db.update_player_last_checked(player['id'])
-
-            # Send the embed to the user
-            await interaction.followup.send(embed=embed, ephemeral=True)
+        # Move the character to the front of the check queue, so the check runs on
+        # a worker like any other and its new runs are announced exactly once
+        key = character_check_key(player)
+        if check_queue.schedule(key, priority=scheduler.HIGH_PRIORITY):
+            await interaction.followup.send(
+                f"Queued {name}-{realm} ({region}) for an immediate check. "
+                f"New runs will be announced in the notification channel.",
+                ephemeral=True
+            )
+        else:
+            await interaction.followup.send(
+                f"{name}-{realm} ({region}) is already queued or being checked.",
+                ephemeral=True
+            )
 
     except Exception as e:
         logger.error(f"Error in check_runs command: {e}")
@@ -1,50 +1,368 @@
 import aiohttp
 import asyncio
 import json
-from datetime import datetime
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import unquote, urlparse
 import config
+import http_client
+from run_details_parser import parse_run_details
+from scheduler import parse_timestamp
 
 # Import current season information from raiderio_dungeons
 # This ensures we're using the same season information everywhere
 from raiderio_dungeons import CURRENT_SEASON
 
+# Backoff settings for throttled (429) and failed (5xx) requests
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# Character profile field presets, so each caller asks for the smallest payload it can use.
+# The base profile (name, realm, class, spec) comes with every preset.
+PROFILE_FIELDS_RECENT_RUNS = "mythic_plus_recent_runs"
+PROFILE_FIELDS_NOTIFICATION = f"mythic_plus_recent_runs,mythic_plus_scores_by_season:{CURRENT_SEASON}"
+
+# Most profiles whose ETag / Last-Modified validators are remembered
+PROFILE_VALIDATORS_MAX_SIZE = 20000
+
+# Returned instead of a profile when a conditional request finds it unchanged
+NOT_MODIFIED = object()
+
+class RateLimiter:
+    """Token bucket limiting how fast requests are sent to Raider.io"""
+
+    def __init__(self, requests_per_minute):
+        """Initialize the limiter with a requests-per-minute budget"""
+        self.rate = requests_per_minute / 60.0
+        # Allow a burst of up to one second worth of requests
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = None
+
+        # Counters
+        self.requests = 0
+        self.throttled = 0
+        self.server_errors = 0
+        self.retries = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    # Raider.io asked us to back off, so hold every request
+                    wait = self.paused_until - now
+                else:
+                    elapsed = now - self.last_refill
+                    self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                    self.last_refill = now
+
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.requests += 1
+                        return
+
+                    wait = (1 - self.tokens) / self.rate
+
+                self.waits += 1
+                self.wait_seconds += wait
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold all requests for the given number of seconds after a 429"""
+        self.throttled += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def get_stats(self):
+        """Get the limiter counters"""
+        return {
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "server_errors": self.server_errors,
+            "retries": self.retries,
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 2)
+        }
+
+# Shared by every RaiderIO instance so the budget applies to the whole bot
+rate_limiter = RateLimiter(config.RAIDERIO_REQUESTS_PER_MINUTE)
+
+class RunDetailsCache:
+    """Size-bounded LRU cache of run details with a time-to-live"""
+
+    def __init__(self, max_size, ttl_seconds):
+        """Initialize the cache"""
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Get cached run details, or None if missing or expired"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Store run details, evicting the least recently used entries"""
+        if self.max_size <= 0:
+            return
+
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self):
+        """Get the cache counters"""
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+class ValidatorCache:
+    """Size-bounded LRU map of HTTP validators for conditional requests"""
+
+    def __init__(self, max_size):
+        """Initialize the cache"""
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+        # Counters
+        self.not_modified = 0
+        self.modified = 0
+
+    def get_headers(self, key):
+        """Get the If-None-Match / If-Modified-Since headers for a request, or None"""
+        validators = self.entries.get(key)
+        if validators is None:
+            return None
+
+        self.entries.move_to_end(key)
+        etag, last_modified = validators
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def store(self, key, response_headers):
+        """Remember the validators of a full response, if the API sent any"""
+        etag = response_headers.get("ETag")
+        last_modified = response_headers.get("Last-Modified")
+        if not etag and not last_modified:
+            self.entries.pop(key, None)
+            return
+
+        self.entries[key] = (etag, last_modified)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def discard(self, key):
+        """Forget a response's validators, so the next request fetches it in full"""
+        self.entries.pop(key, None)
+
+    def get_stats(self):
+        """Get the cache counters"""
+        return {
+            "size": len(self.entries),
+            "not_modified": self.not_modified,
+            "modified": self.modified
+        }
+
+# Shared by every RaiderIO instance, keyed by (name, realm, region, fields)
+profile_validators = ValidatorCache(PROFILE_VALIDATORS_MAX_SIZE)
+
+# Shared by every RaiderIO instance, keyed by (keystone_run_id, season)
+run_details_cache = RunDetailsCache(config.RUN_DETAILS_CACHE_SIZE, config.RUN_DETAILS_CACHE_TTL)
+
+# Run-details requests currently in flight, so concurrent callers share one request
+_pending_run_details = {}
+
+def parse_retry_after(value):
+    """Parse a Retry-After header given either in seconds or as an HTTP date"""
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def get_backoff_delay(attempt, retry_after=None):
+    """Get a jittered exponential backoff delay, never shorter than Retry-After"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+    delay = random.uniform(delay / 2, delay)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+def ensure_run_id(run):
+    """Give a run a mythic_plus_id if it lacks one and return it
+
+    Uses keystone_run_id when available, otherwise a stable hash of the
+    dungeon, level and completion time.
+    """
+    if "mythic_plus_id" not in run:
+        if "keystone_run_id" in run:
+            run["mythic_plus_id"] = run["keystone_run_id"]
+        else:
+            import hashlib
+            dungeon_name = run.get("dungeon", "unknown")
+            if isinstance(dungeon_name, dict):
+                dungeon_name = dungeon_name.get("name", "unknown")
+
+            unique_string = f"{dungeon_name}_{run.get('mythic_level', 0)}_{run.get('completed_at', '')}"
+            run["mythic_plus_id"] = int(hashlib.md5(unique_string.encode()).hexdigest(), 16) % 10**10  # 10-digit number
+    return run["mythic_plus_id"]
+
+def run_watermark(run):
+    """Get the (completed_at, run ID) position of a run, newer runs sort higher"""
+    completed_at = parse_timestamp(run.get("completed_at")) or datetime.min.replace(tzinfo=timezone.utc)
+    return completed_at, ensure_run_id(run)
+
+def get_profile_fingerprint(data):
+    """Get a compact fingerprint of a profile's recent runs, as "newest run ID:count"
+
+    Computed from the raw list without parsing or filtering it, so unchanged
+    profiles can be recognised before any other work.
+    """
+    runs = data.get("mythic_plus_recent_runs") if isinstance(data, dict) else None
+    if not isinstance(runs, list):
+        return None
+
+    run_ids = [run.get("keystone_run_id") or 0 for run in runs if isinstance(run, dict)]
+    return f"{max(run_ids, default=0)}:{len(runs)}"
+
+def get_profile_realm_slug(data):
+    """Get a profile's realm slug from its profile_url, or None
+
+    Profiles only name the realm, the URL (/characters/{region}/{realm-slug}/{name})
+    carries the slug that run rosters use.
+    """
+    profile_url = data.get("profile_url") if isinstance(data, dict) else None
+    if not isinstance(profile_url, str):
+        return None
+
+    parts = urlparse(profile_url).path.strip("/").split("/")
+    if len(parts) != 4 or parts[0] != "characters":
+        return None
+    return unquote(parts[2]).lower() or None
+
+def is_new_run(run, last_run_id, last_run_completed_at=None):
+    """Check whether a run is past a player's (last_run_completed_at, last_run_id) watermark
+
+    Players stored before the watermark had a completion time fall back to
+    comparing run IDs.
+    """
+    last_completed_at = parse_timestamp(last_run_completed_at)
+    if last_completed_at is None:
+        return ensure_run_id(run) > (last_run_id or 0)
+    return run_watermark(run) > (last_completed_at, last_run_id or 0)
+
+def profile_validators_key(name, realm, region, fields):
+    """Get the profile_validators key of a profile request"""
+    return name.lower(), realm.lower(), region.lower(), fields
+
 class RaiderIO:
-    def __init__(self, base_url=config.RAIDERIO_API_URL):
+    def __init__(self, base_url=config.RAIDERIO_API_URL, session=None):
         """Initialize the Raider.io API client"""
         self.base_url = base_url
-        self.session = None
+        self.session = session
+        self._owns_session = False
 
     async def __aenter__(self):
-        """Create session when used as async context manager"""
-        self.session = aiohttp.ClientSession()
+        """Attach to the shared session when used as async context manager"""
+        self._ensure_session()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """Close session when exiting async context manager"""
-        if self.session:
-            await self.session.close()
-            self.session = None
+        """Release the session when exiting async context manager"""
+        await self.close()
+
+    def _ensure_session(self):
+        """Use the shared session if it is open, otherwise create a private one"""
+        if self.session is not None and not self.session.closed:
+            return
+
+        shared = http_client.get_session()
+        if shared is not None:
+            self.session = shared
+            self._owns_session = False
+        else:
+            self.session = http_client.create_session()
+            self._owns_session = True
 
-    async def get_character_profile(self, name, realm, region='us', fields=None):
-        """Get character profile from Raider.io API"""
+    async def get_character_profile(self, name, realm, region='us', fields=None, conditional=False):
+        """Get character profile from Raider.io API
+
+        fields defaults to PROFILE_FIELDS_NOTIFICATION. With conditional, the
+        request carries the validators of the last full response and returns
+        NOT_MODIFIED if the API answers 304.
+        """
         if fields is None:
-            # Use the current season for scores
-            fields = f"mythic_plus_recent_runs,mythic_plus_scores_by_season:{CURRENT_SEASON}"
+            fields = PROFILE_FIELDS_NOTIFICATION
 
         endpoint = f"{self.base_url}/characters/profile"
         params = {
             "region": region,
             "realm": realm,
-            "name": name,
-            "fields": fields
+            "name": name
         }
+        if fields:
+            params["fields"] = fields
+
+        validators_key = profile_validators_key(name, realm, region, fields) if conditional else None
+        return await self._make_request(endpoint, params, validators_key=validators_key)
+
+    async def get_character_mythic_plus_runs(self, name, realm, region='us', conditional=False):
+        """Get a character's base profile and recent mythic+ runs, enough to spot new runs"""
+        return await self.get_character_profile(name, realm, region, PROFILE_FIELDS_RECENT_RUNS, conditional)
 
-        return await self._make_request(endpoint, params)
+    async def get_character_notification_context(self, name, realm, region='us'):
+        """Get a character's recent runs and current season score, everything a run embed shows"""
+        return await self.get_character_profile(name, realm, region, PROFILE_FIELDS_NOTIFICATION)
 
-    async def get_character_mythic_plus_runs(self, name, realm, region='us'):
-        """Get character mythic+ runs from Raider.io API"""
-        fields = f"mythic_plus_recent_runs,mythic_plus_scores_by_season:{CURRENT_SEASON}"
-        return await self.get_character_profile(name, realm, region, fields)
+    def forget_profile(self, name, realm, region='us'):
+        """Make the next conditional request for a character fetch its profile in full"""
+        profile_validators.discard(profile_validators_key(name, realm, region, PROFILE_FIELDS_RECENT_RUNS))
 
     async def get_mythic_plus_run(self, run_id, season=None):
         """Get details for a specific mythic+ run"""
@@ -57,7 +375,27 @@ class RaiderIO:
 
         params["season"] = season
 
-        return await self._make_request(endpoint, params)
+        key = (int(run_id), season)
+        cached = run_details_cache.get(key)
+        if cached is not None:
+            return cached
+
+        pending = _pending_run_details.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        _pending_run_details[key] = future
+        try:
+            run_details = await self._make_request(endpoint, params, parse=parse_run_details)
+            if run_details:
+                run_details_cache.set(key, run_details)
+            future.set_result(run_details)
+            return run_details
+        finally:
+            if not future.done():
+                future.set_result(None)
+            del _pending_run_details[key]
 
     async def get_run_details(self, run_data):
         """Get detailed information for a run, including roster"""
@@ -113,32 +451,87 @@ class RaiderIO:
             print(f"Run details is not a dictionary: {type(run_details)}")
             return run_data
 
-    async def _make_request(self, endpoint, params=None):
-        """Make a request to the Raider.io API"""
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
+    async def _make_request(self, endpoint, params=None, parse=None, validators_key=None):
+        """Make a request to the Raider.io API, retrying throttled and failed requests
+
+        parse, if given, decodes the raw response body instead of response.json().
+        validators_key, if given, makes the request conditional on the validators
+        stored under it in profile_validators, and a 304 returns NOT_MODIFIED.
+        """
+        self._ensure_session()
+
+        headers = profile_validators.get_headers(validators_key) if validators_key else None
+
+        max_retries = config.RAIDERIO_MAX_RETRIES
+        for attempt in range(max_retries + 1):
+            await rate_limiter.acquire()
+
+            try:
+                async with self.session.get(endpoint, params=params, headers=headers) as response:
+                    if response.status == 304 and validators_key:
+                        profile_validators.not_modified += 1
+                        return NOT_MODIFIED
+
+                    if response.status == 200:
+                        if parse is None:
+                            data = await response.json()
+                        else:
+                            try:
+                                data = parse(await response.read())
+                            except ValueError as e:
+                                print(f"Invalid JSON response from {endpoint}: {e}")
+                                return None
+
+                        # Only a fully decoded response may be answered with a 304 later
+                        if validators_key:
+                            profile_validators.modified += 1
+                            profile_validators.store(validators_key, response.headers)
+                        return data
 
-        try:
-            async with self.session.get(endpoint, params=params) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
                     error_text = await response.text()
+
+                    if response.status == 429 or response.status >= 500:
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        delay = get_backoff_delay(attempt, retry_after)
+
+                        if response.status == 429:
+                            # Slow every request down, not just this one
+                            rate_limiter.pause(delay)
+                        else:
+                            rate_limiter.server_errors += 1
+
+                        if attempt < max_retries:
+                            print(f"API Error ({response.status}), retrying in {delay:.1f}s "
+                                  f"(attempt {attempt + 1}/{max_retries})")
+                            rate_limiter.retries += 1
+                            if response.status != 429:
+                                await asyncio.sleep(delay)
+                            continue
+
                     # Be less noisy about 404 errors for run details - this is expected
                     if response.status == 404 and "run-details" in endpoint:
                         print(f"Run details not available (404) - this is normal for older runs")
                     else:
                         print(f"API Error ({response.status}): {error_text}")
                     return None
-        except aiohttp.ClientError as e:
-            print(f"Request error: {e}")
-            return None
+            except aiohttp.ClientError as e:
+                print(f"Request error: {e}")
+            except asyncio.TimeoutError:
+                print(f"Request timed out after {config.RAIDERIO_REQUEST_TIMEOUT}s: {endpoint}")
+
+            # Retry connection errors and timeouts with backoff as well
+            if attempt < max_retries:
+                rate_limiter.retries += 1
+                await asyncio.sleep(get_backoff_delay(attempt))
+
+        return None
 
     async def close(self):
-        """Close the aiohttp session"""
-        if self.session:
+        """Close the aiohttp session if this client created it"""
+        if self.session and self._owns_session:
             await self.session.close()
-            self.session = None
+        self.session = None
+        self._owns_session = False
 
     def parse_mythic_plus_runs(self, data):
         """Parse mythic+ runs from API response"""
@@ -307,21 +700,7 @@ class RaiderIO:
                 latest_run = sorted_runs[0]
 
                 # If the run doesn't have mythic_plus_id, add it using keystone_run_id or generate one
-                if "mythic_plus_id" not in latest_run:
-                    if "keystone_run_id" in latest_run:
-                        latest_run["mythic_plus_id"] = latest_run["keystone_run_id"]
-                        print(f"Using keystone_run_id as mythic_plus_id: {latest_run['mythic_plus_id']}")
-                    else:
-                        # Generate a unique ID based on dungeon, level, and completed_at
-                        import hashlib
-                        dungeon_name = latest_run.get("dungeon", "unknown")
-                        if isinstance(dungeon_name, dict):
-                            dungeon_name = dungeon_name.get("name", "unknown")
-
-                        unique_string = f"{dungeon_name}_{latest_run.get('mythic_level', 0)}_{latest_run.get('completed_at', '')}"
-                        unique_id = int(hashlib.md5(unique_string.encode()).hexdigest(), 16) % 10**10  # 10-digit number
-                        latest_run["mythic_plus_id"] = unique_id
-                        print(f"Generated unique ID as mythic_plus_id: {latest_run['mythic_plus_id']}")
+                ensure_run_id(latest_run)
 
                 print(f"Latest run: {latest_run.get('mythic_plus_id')} completed at {latest_run.get('completed_at')}")
                 return latest_run
@@ -336,22 +715,29 @@ class RaiderIO:
             # If sorting fails, just return the first run if available
             if valid_runs:
                 # Add mythic_plus_id if needed
-                if "mythic_plus_id" not in valid_runs[0]:
-                    if "keystone_run_id" in valid_runs[0]:
-                        valid_runs[0]["mythic_plus_id"] = valid_runs[0]["keystone_run_id"]
-                    else:
-                        # Generate a unique ID
-                        import hashlib
-                        dungeon_name = valid_runs[0].get("dungeon", "unknown")
-                        if isinstance(dungeon_name, dict):
-                            dungeon_name = dungeon_name.get("name", "unknown")
-
-                        unique_string = f"{dungeon_name}_{valid_runs[0].get('mythic_level', 0)}_{valid_runs[0].get('completed_at', '')}"
-                        unique_id = int(hashlib.md5(unique_string.encode()).hexdigest(), 16) % 10**10  # 10-digit number
-                        valid_runs[0]["mythic_plus_id"] = unique_id
+                ensure_run_id(valid_runs[0])
 
                 print(f"Returning first run as fallback: {valid_runs[0].get('mythic_plus_id')}")
                 return valid_runs[0]
             else:
                 print("No valid runs to return as fallback")
                 return None
+
+    def get_new_runs(self, runs, last_run_id, last_run_completed_at=None):
+        """Get every run past a player's watermark, oldest first
+
+        A player that has not seen any run yet only gets the latest one, so
+        a freshly tracked character does not announce its whole history.
+        """
+        if not isinstance(runs, list):
+            return []
+
+        new_runs = sorted(
+            (run for run in runs
+             if isinstance(run, dict) and "completed_at" in run
+             and is_new_run(run, last_run_id, last_run_completed_at)),
+            key=run_watermark
+        )
+        if not last_run_id and not last_run_completed_at:
+            return new_runs[-1:]
+        return new_runs
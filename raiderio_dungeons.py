@@ -1,4 +1,3 @@
-import aiohttp
 import asyncio
 import json
 import logging
@@ -7,6 +6,7 @@ import os
 from datetime import datetime
 
 import config
+import http_client
 
 # Set up logging
 logging.basicConfig(
@@ -124,7 +124,7 @@ async def fetch_current_dungeons():
     """Fetch the current season dungeons from Raider.io API"""
     logger.info(f"Fetching dungeons for expansion {CURRENT_EXPANSION}...")
 
-    async with aiohttp.ClientSession() as session:
+    async with http_client.session_scope() as session:
         # Try to get the current season dungeons
         try:
             # Use the mythic-plus/static-data endpoint
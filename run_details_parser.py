@@ -0,0 +1,86 @@
+"""Selective parser for Raider.io run-details responses
+
+A run-details reply is several megabytes, most of it in
+logged_details.encounters and logged_details.enemies, which the bot never
+reads. parse_run_details walks the response body key by key down to those
+values and steps over them, decoding everything else with the stdlib decoder.
+Skipped values are scanned with a decoder that discards every object as soon
+as it closes, so their object graph is never held in memory.
+"""
+import json
+import re
+from json.decoder import scanstring
+
+# Values skipped rather than decoded, as the path of keys leading to them
+SKIPPED_FIELDS = frozenset({
+    ("logged_details", "encounters"),
+    ("logged_details", "enemies")
+})
+
+# Objects on the way to a skipped value, these are walked key by key
+_SKIPPED_PARENTS = frozenset(path[:depth] for path in SKIPPED_FIELDS for depth in range(len(path)))
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+_decoder = json.JSONDecoder()
+
+# Decoder used only to find where a skipped value ends
+_skipping_decoder = json.JSONDecoder(object_pairs_hook=lambda pairs: None)
+
+def parse_run_details(body):
+    """Decode a run-details response body, leaving out SKIPPED_FIELDS
+
+    Accepts the raw bytes or text of the response and raises
+    json.JSONDecodeError on malformed input, like json.loads.
+    """
+    if isinstance(body, (bytes, bytearray)):
+        body = body.decode('utf-8')
+
+    value, end = _parse_value(body, _skip_whitespace(body, 0), ())
+    if _skip_whitespace(body, end) != len(body):
+        raise json.JSONDecodeError("Extra data", body, end)
+    return value
+
+def _skip_whitespace(text, pos):
+    return _WHITESPACE.match(text, pos).end()
+
+def _parse_value(text, pos, path):
+    """Decode the value at pos, returns (value, end)"""
+    if path in _SKIPPED_PARENTS and text.startswith('{', pos):
+        return _parse_object(text, pos, path)
+    return _decoder.raw_decode(text, pos)
+
+def _parse_object(text, pos, path):
+    """Decode an object key by key so skipped children are never built"""
+    result = {}
+    pos = _skip_whitespace(text, pos + 1)
+    if text.startswith('}', pos):
+        return result, pos + 1
+
+    while True:
+        if not text.startswith('"', pos):
+            raise json.JSONDecodeError("Expecting property name enclosed in double quotes", text, pos)
+        key, pos = scanstring(text, pos + 1)
+
+        pos = _skip_whitespace(text, pos)
+        if not text.startswith(':', pos):
+            raise json.JSONDecodeError("Expecting ':' delimiter", text, pos)
+        pos = _skip_whitespace(text, pos + 1)
+
+        child_path = path + (key,)
+        if child_path in SKIPPED_FIELDS:
+            pos = _skip_value(text, pos)
+        else:
+            result[key], pos = _parse_value(text, pos, child_path)
+
+        pos = _skip_whitespace(text, pos)
+        if text.startswith(',', pos):
+            pos = _skip_whitespace(text, pos + 1)
+        elif text.startswith('}', pos):
+            return result, pos + 1
+        else:
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+
+def _skip_value(text, pos):
+    """Find the end of the value at pos without keeping it"""
+    return _skipping_decoder.raw_decode(text, pos)[1]
@@ -0,0 +1,224 @@
+"""Adaptive polling schedule for tracked characters
+
+A character that just completed a key is polled every CHECK_INTERVAL
+seconds. Every check that finds nothing new doubles its interval, up to a
+ceiling that grows with the time since its last run and never exceeds
+MAX_CHECK_INTERVAL, so dormant characters back off while active ones stay hot.
+
+CheckQueue keeps every tracked character in a heap ordered by due time, and
+the polling workers pull the next due character from it.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta, timezone
+
+import config
+
+# A character idle for N seconds may be polled every N / IDLE_TO_INTERVAL_RATIO seconds
+IDLE_TO_INTERVAL_RATIO = 4
+
+# Interval multiplier applied after a check that found no new run
+BACKOFF_FACTOR = 2
+
+# Queue priorities, high priority checks (e.g. /check_all) jump ahead of everything
+HIGH_PRIORITY = 0
+NORMAL_PRIORITY = 1
+
+def utc_now():
+    """Get the current time as an aware UTC datetime"""
+    return datetime.now(timezone.utc)
+
+def parse_timestamp(value):
+    """Parse a stored or Raider.io timestamp into an aware UTC datetime, or None"""
+    if not value:
+        return None
+
+    if isinstance(value, datetime):
+        timestamp = value
+    else:
+        try:
+            timestamp = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+def parse_local_timestamp(value):
+    """Parse a naive local timestamp, as datetime.now() values are stored, into an aware UTC datetime"""
+    if not value:
+        return None
+
+    try:
+        timestamp = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    # astimezone treats a naive datetime as local time
+    return timestamp.astimezone(timezone.utc)
+
+def activity_ceiling(last_run_at, now=None):
+    """Get the longest polling interval in seconds for a character's activity"""
+    last_run_at = parse_timestamp(last_run_at)
+    if last_run_at is None:
+        return config.MAX_CHECK_INTERVAL
+
+    now = now or utc_now()
+    idle_seconds = max(0, (now - last_run_at).total_seconds())
+    ceiling = int(idle_seconds / IDLE_TO_INTERVAL_RATIO)
+    return max(config.CHECK_INTERVAL, min(config.MAX_CHECK_INTERVAL, ceiling))
+
+def next_check_interval(previous_interval, found_new_run, last_run_at, now=None):
+    """Get the polling interval in seconds to use after a check"""
+    if found_new_run:
+        return config.CHECK_INTERVAL
+
+    interval = (previous_interval or config.CHECK_INTERVAL) * BACKOFF_FACTOR
+    return max(config.CHECK_INTERVAL, min(interval, activity_ceiling(last_run_at, now)))
+
+def next_check_time(interval, now=None):
+    """Get the time a character is next due, as a stored timestamp string"""
+    now = now or utc_now()
+    return (now + timedelta(seconds=interval)).isoformat()
+
+def due_timestamp(next_check_at):
+    """Get a stored next_check_at as a Unix timestamp, rows never scheduled are due now"""
+    due_at = parse_timestamp(next_check_at)
+    return due_at.timestamp() if due_at else time.time()
+
+class CheckQueue:
+    """Priority queue of characters waiting to be checked
+
+    Characters are keyed by (name, realm, region) and ordered by due time.
+    A character is either queued once or in flight, never both, so the same
+    character is not fetched twice at the same time.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._in_flight = set()
+        self._counter = itertools.count()
+        # Created by the first get(), so it belongs to the loop the workers run on
+        self._changed = None
+        self.completed = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _push(self, key, due_at, priority):
+        """Add or move a character's heap entry"""
+        self._remove(key)
+        entry = [due_at, priority, next(self._counter), key]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if self._changed is not None:
+            self._changed.set()
+
+    def _remove(self, key):
+        """Drop a character's heap entry, it is skipped when it reaches the top"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[-1] = None
+
+    def schedule(self, key, due_at=None, priority=NORMAL_PRIORITY):
+        """Queue a character, or move it earlier if it is already queued
+
+        High priority entries are due immediately. Returns False if the
+        character is in flight or already queued at least as early.
+        """
+        if key in self._in_flight:
+            return False
+
+        if priority == HIGH_PRIORITY:
+            due_at = 0
+        elif due_at is None:
+            due_at = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None and (entry[0], entry[1]) <= (due_at, priority):
+            return False
+
+        self._push(key, due_at, priority)
+        return True
+
+    def defer(self, key, due_at):
+        """Push a queued character's check back to due_at
+
+        Returns False if the character is not queued, has a high priority
+        check pending or is already due at or after due_at.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[1] == HIGH_PRIORITY or entry[0] >= due_at:
+            return False
+
+        self._push(key, due_at, NORMAL_PRIORITY)
+        return True
+
+    def sync(self, due_times):
+        """Queue newly tracked characters and drop untracked ones
+
+        due_times maps each tracked character to its stored due time. Characters
+        already queued or in flight keep their in-memory schedule.
+        Returns the number of characters added.
+        """
+        added = 0
+        for key, due_at in due_times.items():
+            if key not in self._entries and key not in self._in_flight:
+                self._push(key, due_at, NORMAL_PRIORITY)
+                added += 1
+
+        for key in list(self._entries):
+            if key not in due_times:
+                self._remove(key)
+        return added
+
+    async def get(self):
+        """Wait for the next due character and mark it in flight"""
+        if self._changed is None:
+            self._changed = asyncio.Event()
+
+        while True:
+            while self._heap and self._heap[0][-1] is None:
+                heapq.heappop(self._heap)
+
+            timeout = None
+            if self._heap:
+                timeout = self._heap[0][0] - time.time()
+                if timeout <= 0:
+                    key = heapq.heappop(self._heap)[-1]
+                    del self._entries[key]
+                    self._in_flight.add(key)
+                    return key
+
+            # asyncio.wait rather than wait_for, which can swallow a cancellation
+            # that arrives just as the event is set and leave the worker running
+            self._changed.clear()
+            waiter = asyncio.ensure_future(self._changed.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=timeout)
+            finally:
+                waiter.cancel()
+
+    def done(self, key, next_due_at=None):
+        """Mark a character's check finished and queue its next check"""
+        self._in_flight.discard(key)
+        self.completed += 1
+        if next_due_at is not None:
+            self._push(key, next_due_at, NORMAL_PRIORITY)
+
+    def get_stats(self):
+        """Get queue metrics for logging"""
+        now = time.time()
+        overdue = [entry[0] for entry in self._entries.values() if entry[0] <= now]
+        # High priority entries are queued as due at 0, so they carry no lag
+        lags = [now - due_at for due_at in overdue if due_at]
+        return {
+            "queued": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "overdue": len(overdue),
+            "max_lag_seconds": round(max(lags), 1) if lags else 0,
+            "completed": self.completed
+        }
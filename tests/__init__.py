@@ -0,0 +1,26 @@
+"""Tests, run with python -m pytest or python -m unittest discover"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# config refuses to import without these, none of them are used by the tests
+for name, value in {
+    "DISCORD_TOKEN": "test",
+    "CHECK_INTERVAL": "60",
+    "RAIDERIO_API_URL": "http://127.0.0.1/api/v1",
+    "API_ACCESS_KEY": "test",
+    "CURRENT_EXPANSION": "10",
+    "CURRENT_SEASON": "season-tww-3",
+    "CURRENT_SEASON_SHORT": "TWW3",
+    "EMBED_COLOR": "39423",
+    "WEB_HOST": "127.0.0.1",
+    "WEB_PORT": "5000",
+    "WEB_DEBUG": "false",
+    "CLIENT_ID": "0",
+    "FLASK_SECRET_KEY": "test",
+    "DATABASE_FILE": os.path.join(tempfile.gettempdir(), "mythic-tracker-test.db")
+}.items():
+    os.environ.setdefault(name, value)
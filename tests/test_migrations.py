@@ -0,0 +1,37 @@
+"""Check that an interrupted schema migration is retried cleanly"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import database
+
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.db = database.Database(os.path.join(self.workdir.name, "test.db"))
+
+    def tearDown(self):
+        database.close_connection_pools()
+        self.workdir.cleanup()
+
+    def test_failed_step_is_rolled_back_and_retried(self):
+        def broken_step(conn):
+            conn.execute('ALTER TABLE players ADD COLUMN next_check_at TIMESTAMP')
+            raise sqlite3.OperationalError("interrupted")
+
+        self.db._add_check_schedule = broken_step
+        with self.assertRaises(sqlite3.OperationalError):
+            self.db.migrate()
+        del self.db._add_check_schedule
+
+        self.db.migrate()
+
+        with self.db._reader() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            columns = [column[1] for column in conn.execute('PRAGMA table_info(players)').fetchall()]
+        self.assertEqual(version, database.SCHEMA_MIGRATIONS[-1][0])
+        self.assertIn('next_check_at', columns)
+        self.assertIn('check_interval', columns)
+
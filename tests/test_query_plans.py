@@ -0,0 +1,21 @@
+"""Check that the hot queries stay index-backed on a freshly migrated database"""
+import os
+import tempfile
+import unittest
+
+import database
+
+
+class QueryPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.db = database.Database(os.path.join(self.workdir.name, "test.db"))
+        self.db.migrate()
+
+    def tearDown(self):
+        database.close_connection_pools()
+        self.workdir.cleanup()
+
+    def test_hot_queries_use_indexes(self):
+        self.assertEqual(self.db.check_query_plans(), [])
+
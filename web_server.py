@@ -92,4 +92,10 @@ def run_web_server():
         logger.error(f"Error running web server: {e}")
 
 if __name__ == "__main__":
+    # When running on its own the bot has not migrated the schema for us
+    from database import Database
+    db_instance = Database()
+    db_instance.migrate()
+    db_instance.close()
+
     run_web_server()